@@ -0,0 +1,151 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+GATE_OPEN_COMMAND = '1'
+GATE_CLOSE_COMMAND = '0'
+GATE_CLOSE_KEY = 'gate-close'
+
+log = logging.getLogger(__name__)
+
+
+class _Job:
+    __slots__ = ('due', 'seq', 'key', 'command', 'active')
+
+    def __init__(self, due, seq, key, command):
+        self.due = due
+        self.seq = seq
+        self.key = key
+        self.command = command
+        self.active = True
+
+    def __lt__(self, other):
+        return (self.due, self.seq) < (other.due, other.seq)
+
+
+class ActuatorScheduler:
+    """Sends timed Arduino commands from a background thread.
+
+    Callers never sleep: "open now, close in 15 s" is two scheduled jobs and
+    the vision loop keeps running while the gate is open. Jobs can be given a
+    key so they can later be cancelled, extended or replaced.
+    """
+
+    def __init__(self, send_command):
+        self.send_command = send_command  # command str -> bool, e.g. a gate policy's send_command
+        self.running = False
+        self._heap = []
+        self._jobs = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name="actuator-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the worker, sending any still-pending jobs right away so the gate is not left open"""
+        with self._cond:
+            self.running = False
+            pending = sorted(job for job in self._heap if job.active)
+            self._heap = []
+            self._jobs = {}
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+        for job in pending:
+            self.send_command(job.command)
+
+    # ===== Job control =====
+    def schedule(self, command, delay=0, key=None):
+        """Send command after delay seconds; an existing job with the same key is replaced"""
+        with self._cond:
+            seq = next(self._seq)
+            key = key or f"job-{seq}"
+            self._deactivate(key)
+            job = _Job(time.monotonic() + delay, seq, key, command)
+            self._jobs[key] = job
+            heapq.heappush(self._heap, job)
+            self._cond.notify()
+            return key
+
+    def cancel(self, key):
+        with self._cond:
+            return self._deactivate(key) is not None
+
+    def extend(self, key, seconds):
+        """Push a pending job back by seconds; returns False if it already ran or was cancelled"""
+        with self._cond:
+            job = self._deactivate(key)
+            if job is None:
+                return False
+            self._jobs[key] = new_job = _Job(job.due + seconds, next(self._seq), key, job.command)
+            heapq.heappush(self._heap, new_job)
+            self._cond.notify()
+            return True
+
+    def time_left(self, key):
+        """Seconds until the job with this key fires, or None if nothing is pending"""
+        with self._cond:
+            job = self._jobs.get(key)
+            return max(0.0, job.due - time.monotonic()) if job else None
+
+    # ===== Gate and buzzer =====
+    def open_gate(self, duration=15):
+        """Open the gate now and close it after duration seconds.
+
+        Opening an already open gate only pushes the close back, so a second
+        car following closely does not get the barrier lowered on it.
+        """
+        left = self.time_left(GATE_CLOSE_KEY)
+        if left is not None:
+            if duration > left:
+                self.extend(GATE_CLOSE_KEY, duration - left)
+            log.info("[GATE] Already open, closing in %.0fs", max(left, duration))
+            return
+        self.schedule(GATE_OPEN_COMMAND)
+        self.schedule(GATE_CLOSE_COMMAND, delay=duration, key=GATE_CLOSE_KEY)
+        log.info("[GATE] Opening gate for %ss", duration)
+
+    def close_gate(self):
+        self.cancel(GATE_CLOSE_KEY)
+        self.schedule(GATE_CLOSE_COMMAND)
+
+    def gate_open(self):
+        return self.time_left(GATE_CLOSE_KEY) is not None
+
+    def buzz(self, pattern):
+        """Trigger a buzzer pattern ('D', 'P', 'U', ...); the Arduino plays it without blocking us"""
+        self.schedule(pattern)
+
+    # ===== Worker =====
+    def _deactivate(self, key):
+        job = self._jobs.pop(key, None)
+        if job:
+            job.active = False
+        return job
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self.running:
+                        return
+                    while self._heap and not self._heap[0].active:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0].due - time.monotonic()
+                    if delay <= 0:
+                        job = heapq.heappop(self._heap)
+                        self._jobs.pop(job.key, None)
+                        break
+                    self._cond.wait(delay)
+            if not self.send_command(job.command):
+                log.error("[SCHEDULER] Command '%s' (%s) was not delivered", job.command, job.key)
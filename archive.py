@@ -0,0 +1,195 @@
+import argparse
+import glob
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+ARCHIVE_AFTER_DAYS = 180
+ARCHIVE_BATCH_SIZE = 500  # rows moved per write transaction
+BATCH_PAUSE = 0.05  # seconds between batches, so lane writes get the lock in between
+UNDATED = 'undated'  # partition for rows whose timestamp doesn't parse
+
+# Closed rows only: stays that have exited or were paid, and rejected exit attempts;
+# the ENTRY row of a car still inside always stays in the hot database.
+ARCHIVE_TABLES = {
+    'plates_log': {
+        'columns': ('id', 'plate_number', 'payment_status', 'entry_timestamp', 'exit_timestamp', 'action_type'),
+        'time': 'entry_timestamp',
+        'closed': "(action_type IN ('EXIT', 'UNAUTHORIZED_EXIT') OR COALESCE(exit_timestamp, '') <> '') "
+                  "AND id NOT IN (SELECT entry_log_id FROM parking_sessions "
+                  "WHERE exit_timestamp IS NULL AND entry_log_id IS NOT NULL)",
+    },
+    'transactions': {
+        'columns': ('id', 'plate_number', 'entry_time', 'exit_time', 'duration_hr', 'amount', 'payment_status'),
+        'time': 'exit_time',
+        'closed': "1",
+    },
+}
+
+# Archive files mirror the hot tables and their history indexes, without triggers
+ARCHIVE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS plates_log (
+        id INTEGER PRIMARY KEY,
+        plate_number TEXT NOT NULL,
+        payment_status INTEGER NOT NULL DEFAULT 0,
+        entry_timestamp TEXT,
+        exit_timestamp TEXT,
+        action_type TEXT NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS transactions (
+        id INTEGER PRIMARY KEY,
+        plate_number TEXT NOT NULL,
+        entry_time TEXT,
+        exit_time TEXT,
+        duration_hr REAL,
+        amount INTEGER,
+        payment_status INTEGER
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_plates_log_entry ON plates_log (entry_timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_plates_log_plate_entry ON plates_log (plate_number, entry_timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_plates_log_action_entry ON plates_log (action_type, entry_timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_exit ON transactions (exit_time)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_plate_exit ON transactions (plate_number, exit_time)",
+]
+
+
+def archive_dir(db_file):
+    return os.path.join(os.path.dirname(db_file) or '.', 'archive')
+
+
+def archive_path(db_file, month):
+    return os.path.join(archive_dir(db_file), f"parking-{month}.db")
+
+
+def main_db_file(conn):
+    return next(row[2] for row in conn.execute("PRAGMA database_list") if row[1] == 'main')
+
+
+def archive_months(db_file):
+    """Months that have an archive file next to db_file, newest first"""
+    paths = glob.glob(os.path.join(archive_dir(db_file), 'parking-*.db'))
+    return sorted((os.path.basename(path)[len('parking-'):-len('.db')] for path in paths), reverse=True)
+
+
+def ensure_archive(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    try:
+        for statement in ARCHIVE_SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+@contextmanager
+def attached(conn, path, read_only=True, name='archive'):
+    """ATTACH an archive file for the duration of the block (read-only needs a uri=True connection)"""
+    conn.execute(f"ATTACH DATABASE ? AS {name}", (f"file:{path}?mode=ro" if read_only else path,))
+    try:
+        yield name
+    finally:
+        conn.execute(f"DETACH DATABASE {name}")
+
+
+def archive_batch(conn, table, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move up to batch_size closed rows older than cutoff into their monthly archives; returns rows moved"""
+    spec = ARCHIVE_TABLES[table]
+    time_column = spec['time']
+    rows = conn.execute(f'''
+        SELECT id, COALESCE(strftime('%Y-%m', {time_column}), '{UNDATED}')
+        FROM {table}
+        WHERE {time_column} < ? AND {spec['closed']}
+        ORDER BY {time_column}
+        LIMIT ?
+    ''', (cutoff, batch_size)).fetchall()
+
+    by_month = {}
+    for row_id, month in rows:
+        by_month.setdefault(month, []).append(row_id)
+
+    db_file = main_db_file(conn)
+    columns = ', '.join(spec['columns'])
+    for month, ids in by_month.items():
+        path = archive_path(db_file, month)
+        ensure_archive(path)
+        placeholders = ', '.join('?' * len(ids))
+        with attached(conn, path, read_only=False) as schema:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # OR IGNORE: the two files commit separately, so a batch interrupted
+                # between them is simply copied again on the next run
+                conn.execute(f"INSERT OR IGNORE INTO {schema}.{table} ({columns}) "
+                             f"SELECT {columns} FROM main.{table} WHERE id IN ({placeholders})", ids)
+                conn.execute(f"DELETE FROM main.{table} WHERE id IN ({placeholders})", ids)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    return len(rows)
+
+
+def prune_events(conn, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """Drop change-feed events older than cutoff; dashboards only tail the recent ones"""
+    with conn:
+        cursor = conn.execute('''
+            DELETE FROM parking_events WHERE seq IN (
+                SELECT seq FROM parking_events WHERE created_at < ? ORDER BY seq LIMIT ?)
+        ''', (cutoff, batch_size))
+    return cursor.rowcount
+
+
+def run_archival(conn, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, pause=BATCH_PAUSE):
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime('%Y-%m-%d %H:%M:%S')
+    print(f"[ARCHIVE] Moving closed rows from before {cutoff} in batches of {batch_size}")
+    totals = {}
+    for table in ARCHIVE_TABLES:
+        moved = total = 0
+        while True:
+            moved = archive_batch(conn, table, cutoff, batch_size)
+            total += moved
+            if moved < batch_size:
+                break
+            time.sleep(pause)
+        totals[table] = total
+        print(f"[ARCHIVE] {table}: {total} rows archived")
+
+    pruned = 0
+    while True:
+        removed = prune_events(conn, cutoff, batch_size)
+        pruned += removed
+        if removed < batch_size:
+            break
+        time.sleep(pause)
+    print(f"[ARCHIVE] parking_events: {pruned} old events pruned")
+
+    # Hand the freed WAL back to the filesystem; freed pages are reused by new rows
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return totals
+
+
+def main():
+    import parking_db
+
+    parser = argparse.ArgumentParser(description="Move old closed stays and payments into monthly archive databases")
+    parser.add_argument('--db', default=parking_db.DB_FILE)
+    parser.add_argument('--older-than-days', type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=BATCH_PAUSE, help="seconds to yield the write lock between batches")
+    args = parser.parse_args()
+
+    conn = parking_db.connect(args.db)
+    try:
+        run_archival(conn, args.older_than_days, args.batch_size, args.pause)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -29,7 +29,7 @@ int patternStage = 0;
 
 // Distance check
 unsigned long lastDistanceCheck = 0;
-const unsigned long distanceInterval = 100; // ms
+const unsigned long distanceInterval = 200; // ms
 
 void setup() {
   pinMode(TRIG_PIN, OUTPUT);
@@ -111,10 +111,13 @@ void loop() {
   }
   
   // --- Distance check (less frequent to prioritize serial) ---
-  if (currentMillis - lastDistanceCheck >= 500) {  // Reduced frequency
+  if (currentMillis - lastDistanceCheck >= distanceInterval) {
     lastDistanceCheck = currentMillis;
     long distance = getDistance();
     
+    // Presence feed for the PC: it only runs plate detection while a car is near
+    Serial.println("DIST:" + String(distance));
+    
     if (distance > 0 && distance < 20 && !gateOpen) {
       Serial.println("[INFO] Object Approaching: " + String(distance) + " cm");
     }
@@ -0,0 +1,266 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from detection import DETECT_SIZE, ScaledDetector
+from ocr_cache import OcrCache
+from ocr_service import OcrService, OCR_WORKERS, PyTessBaseAPI
+from plate_consensus import correct_plate
+from plate_ocr import preprocess_plate
+from plate_tracker import PlateTracker, TrackVotes
+
+# Replay sets: plate crops skip detection, dataset frames go through it
+SOURCES = {
+    'plates': ['plates/*.jpg'],
+    'dataset': ['dataset/train/images/*.jpg', 'dataset/val/images/*.jpg'],
+}
+STAGES = ('decode', 'detect', 'track', 'preprocess', 'ocr', 'validate', 'vote')
+PERCENTILES = (50, 95, 99)
+FRAME_INTERVAL = 0.1  # simulated seconds between replayed frames, as a 10 fps camera
+
+
+def list_images(source, limit=None):
+    paths = sorted(path for pattern in SOURCES[source] for path in glob.glob(pattern))
+    return paths[:limit] if limit else paths
+
+
+def label_boxes(image_path, frame):
+    """Ground-truth boxes from the YOLO label file next to a dataset image"""
+    label_path = os.path.splitext(image_path.replace(f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}"))[0] + '.txt'
+    if not os.path.exists(label_path):
+        return []
+    height, width = frame.shape[:2]
+    boxes = []
+    with open(label_path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            cx, cy, w, h = (float(value) for value in parts[1:5])
+            boxes.append((int((cx - w / 2) * width), int((cy - h / 2) * height),
+                          int((cx + w / 2) * width), int((cy + h / 2) * height)))
+    return boxes
+
+
+def make_detector(kind, model_path, detect_size):
+    """path, frame -> boxes for the chosen detector; None for plate crops, which skip detection"""
+    if kind == 'crop':
+        return None
+    if kind == 'labels':
+        return label_boxes
+    from ultralytics import YOLO
+    model = YOLO(model_path)
+    detect = ScaledDetector(lambda image: model(image, imgsz=detect_size, verbose=False)[0], size=detect_size)
+    return lambda path, frame: detect(frame)
+
+
+def summarize(samples):
+    if not samples:
+        return {'count': 0}
+    values = np.array(samples) * 1000
+    summary = {'count': len(samples), 'mean_ms': round(float(values.mean()), 3)}
+    for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f"p{p}_ms"] = round(float(value), 3)
+    return summary
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process, or None where there is no resource module (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)  # bytes on macOS, KiB elsewhere
+
+
+def run_benchmark(paths, detect, ocr, warmup=0, frame_interval=FRAME_INTERVAL):
+    """Replay paths through detect -> track -> preprocess -> OCR -> validate -> vote like a lane does.
+
+    Frames are processed one at a time on this thread with a simulated
+    clock, so the numbers are per-frame costs rather than pipeline overlap.
+    Without a detector every image is already a plate crop of an unknown
+    car, so there is nothing to vote across: each crop is OCR'd and
+    validated once, and the result reports the share of valid reads instead
+    of committed plates.
+    """
+    tracker = PlateTracker()
+    votes = TrackVotes(threshold=0.9)
+    timings = {stage: [] for stage in STAGES}
+    counts = {'frames': 0, 'boxes': 0, 'crops_ocrd': 0, 'valid_reads': 0, 'committed': 0}
+    committed = []
+    calls_before = 0
+    started = None
+
+    for index, path in enumerate(paths):
+        if index == warmup:
+            timings = {stage: [] for stage in STAGES}
+            counts = dict.fromkeys(counts, 0)
+            committed = []
+            calls_before = ocr.calls
+            started = time.perf_counter()
+        now = index * frame_interval
+        sample = {}
+
+        t = time.perf_counter()
+        frame = cv2.imread(path)
+        sample['decode'] = time.perf_counter() - t
+        if frame is None:
+            print(f"[BENCH] Could not read {path}, skipping")
+            continue
+
+        if detect is None:
+            boxes, crops = [(0, 0, frame.shape[1], frame.shape[0])], [(None, frame)]
+        else:
+            t = time.perf_counter()
+            boxes = detect(path, frame) or []
+            sample['detect'] = time.perf_counter() - t
+
+            t = time.perf_counter()
+            crops = []
+            for track, (x1, y1, x2, y2) in tracker.update(boxes, now):
+                plate_img = frame[max(y1, 0):y2, max(x1, 0):x2]
+                if plate_img.size and tracker.select_for_ocr(track, plate_img, now):
+                    crops.append((track.track_id, plate_img))
+            sample['track'] = time.perf_counter() - t
+
+        for stage in STAGES:
+            if stage in sample:
+                timings[stage].append(sample[stage])
+        counts['frames'] += 1
+        counts['boxes'] += len(boxes)
+
+        for track_id, plate_img in crops:
+            counts['crops_ocrd'] += 1
+            t = time.perf_counter()
+            thresh = preprocess_plate(plate_img)
+            timings['preprocess'].append(time.perf_counter() - t)
+
+            t = time.perf_counter()
+            text, confidences, cached = ocr.read_thresholded(thresh)
+            timings['ocr'].append(time.perf_counter() - t)
+
+            t = time.perf_counter()
+            plate, plate_confidences = correct_plate(text, confidences)
+            timings['validate'].append(time.perf_counter() - t)
+            if not plate:
+                continue
+            counts['valid_reads'] += 1
+            if detect is None:
+                continue
+
+            t = time.perf_counter()
+            decided = votes.add(track_id, plate, now, plate_confidences, cached)
+            timings['vote'].append(time.perf_counter() - t)
+            if decided:
+                counts['committed'] += 1
+                committed.append(decided)
+
+    elapsed = time.perf_counter() - started if started is not None else 0.0
+    ocr_calls = ocr.calls - calls_before
+    return {
+        'frames': counts['frames'],
+        'elapsed_s': round(elapsed, 3),
+        'fps': round(counts['frames'] / elapsed, 2) if elapsed else 0.0,
+        'stages': {stage: summarize(samples) for stage, samples in timings.items()},
+        'counts': dict(counts, ocr_calls=ocr_calls, unique_plates=len(set(committed))),
+        'voted': detect is not None,
+        'valid_read_rate': round(counts['valid_reads'] / counts['crops_ocrd'], 3) if counts['crops_ocrd'] else None,
+        'ocr_calls_per_plate': round(ocr_calls / counts['committed'], 2) if counts['committed'] else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def print_summary(result, baseline=None):
+    def delta(value, old):
+        if old in (None, 0) or value is None:
+            return ""
+        return f" ({(value - old) / old:+.0%} vs baseline)"
+
+    base = baseline or {}
+    print(f"[BENCH] {result['frames']} frames in {result['elapsed_s']}s = {result['fps']} fps"
+          f"{delta(result['fps'], base.get('fps'))}")
+    for stage, summary in result['stages'].items():
+        if not summary['count']:
+            continue
+        old = base.get('stages', {}).get(stage, {}).get('p95_ms')
+        print(f"[BENCH] {stage:<10} n={summary['count']:<6} p50 {summary['p50_ms']:.2f} ms | "
+              f"p95 {summary['p95_ms']:.2f} ms | p99 {summary['p99_ms']:.2f} ms{delta(summary['p95_ms'], old)}")
+    counts = result['counts']
+    print(f"[BENCH] {counts['valid_reads']} of {counts['crops_ocrd']} crops read as a valid plate "
+          f"({result['valid_read_rate']}) | {counts['ocr_calls']} OCR calls"
+          f"{delta(result['valid_read_rate'], base.get('valid_read_rate'))}")
+    if result['voted']:
+        print(f"[BENCH] {counts['committed']} plates committed ({counts['unique_plates']} unique) | "
+              f"{result['ocr_calls_per_plate']} OCR calls per plate"
+              f"{delta(result['ocr_calls_per_plate'], base.get('ocr_calls_per_plate'))}")
+    rss = 'n/a' if result['peak_rss_mb'] is None else f"{result['peak_rss_mb']} MB"
+    print(f"[BENCH] Peak RSS {rss}{delta(result['peak_rss_mb'], base.get('peak_rss_mb'))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay plates/ or dataset/ through the recognition path and time it")
+    parser.add_argument('--source', choices=tuple(SOURCES), default='plates')
+    parser.add_argument('--detector', choices=('model', 'labels'), default='model',
+                        help="dataset frames: run YOLO, or use the labelled boxes to time everything after it")
+    parser.add_argument('--model', default='best3.pt')
+    parser.add_argument('--detect-size', type=int, default=DETECT_SIZE)
+    parser.add_argument('--ocr-workers', type=int, default=OCR_WORKERS)
+    parser.add_argument('--no-cache', action='store_true', help="send every selected crop to tesseract")
+    parser.add_argument('--limit', type=int, help="replay only the first N images")
+    parser.add_argument('--warmup', type=int, default=5, help="frames run before timing starts")
+    parser.add_argument('--output', '-o', help="write the results as JSON here")
+    parser.add_argument('--baseline', help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    paths = list_images(args.source, args.limit)
+    if len(paths) <= args.warmup:
+        parser.error(f"only {len(paths)} images found for {args.source}, need more than --warmup {args.warmup}")
+    detector = 'crop' if args.source == 'plates' else args.detector
+    detect = make_detector(detector, args.model, args.detect_size)
+    ocr = OcrService(workers=args.ocr_workers, cache=None if args.no_cache else OcrCache())
+
+    print(f"[BENCH] Replaying {len(paths)} images from {args.source} ({detector} detector, {args.warmup} warmup)")
+    try:
+        result = run_benchmark(paths, detect, ocr, warmup=args.warmup)
+    finally:
+        ocr.close()
+    result['run'] = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'source': args.source,
+        'detector': detector,
+        'model': args.model if detector == 'model' else None,
+        'detect_size': args.detect_size,
+        'ocr_workers': args.ocr_workers,
+        'ocr_cache': not args.no_cache,
+        'ocr_engine': 'tesserocr' if PyTessBaseAPI else 'pytesseract',
+        'images': len(paths),
+        'warmup': args.warmup,
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'machine': platform.platform(),
+    }
+    if ocr.cache:
+        result['ocr_cache'] = ocr.cache.stats()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_summary(result, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"[BENCH] Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,266 +1,154 @@
-import cv2
+import argparse
+import logging
 from ultralytics import YOLO
-import pytesseract
 import os
 import time
-import serial
-import serial.tools.list_ports
-import csv
-from collections import Counter
-import pandas as pd
-from datetime import datetime
-import random
-import sqlite3
+import parking_db
+from parking_sessions import get_session, is_inside, open_session, read_counters, is_full
+from lane_engine import GatePolicy, Lane, add_lane_arguments, open_lane_source, run_lanes, start_monitoring, METRICS_PORT
+from frame_trace import stage_span
+from serial_manager import connect_arduino
+from detection import DETECT_SIZE
+
+log = logging.getLogger('entry')
 
-# Load YOLOv8 model
-model = YOLO('best3.pt')
 save_dir = 'plates'
 os.makedirs(save_dir, exist_ok=True)
 
-# SQLite3 database setup
-db_file = 'data/parking.db'
-os.makedirs(os.path.dirname(db_file), exist_ok=True)
-conn = sqlite3.connect(db_file)
+# SQLite3 database setup (schema, indexes and WAL live in parking_db)
+conn = parking_db.connect()
 cursor = conn.cursor()
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS plates_log (
-    plate_number TEXT,
-    payment_status INTEGER,
-    entry_timestamp TEXT,
-    exit_timestamp TEXT,
-    action_type TEXT
-)
-''')
-conn.commit()
-
-def detect_arduino_port():
-    ports = list(serial.tools.list_ports.comports())
-    for port in ports:
-        if any(x in port.device for x in ["ttyACM", "ttyUSB", "usbmodem", "wchusbserial", "COM"]):
-            return port.device
-    return None
-
-arduino_port = detect_arduino_port()
-arduino = None
-if arduino_port:
-    try:
-        # Optimized serial settings for minimal latency
-        arduino = serial.Serial(
-            arduino_port, 
-            115200,  # Higher baud rate (matches Arduino)
-            timeout=0.1,  # Shorter timeout
-            write_timeout=0.1,  # Write timeout
-            bytesize=serial.EIGHTBITS,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE
-        )
-        # Clear any existing data in buffers
-        arduino.reset_input_buffer()
-        arduino.reset_output_buffer()
-        time.sleep(1)  # Reduced wait time
-        print(f"[CONNECTED] Arduino on {arduino_port}")
-    except Exception as e:
-        print(f"[ERROR] Could not open Arduino serial port: {e}")
-else:
-    print("[ERROR] Arduino not detected.")
-
-
-def send_arduino_command(command):
-    """Send command to Arduino with minimal latency"""
-    if arduino:
-        try:
-            arduino.write(command.encode())
-            arduino.flush()  # Force immediate transmission
-            print(f"[ARDUINO] Sent: {command}")
-            return True
-        except Exception as e:
-            print(f"[ERROR] Arduino communication failed: {e}")
-            return False
-    return False
-
-
-def buzz(code):
-    """Optimized buzzer function with immediate response"""
-    if send_arduino_command(code):
-        print(f"[BUZZER] Triggered: {code}")
-        time.sleep(5)  # Wait for buzzer pattern to complete
-    else:
-        print(f"[ERROR] Failed to trigger buzzer: {code}")
-
-
-def read_parking_log():
-    cursor.execute("SELECT * FROM plates_log")
-    rows = cursor.fetchall()
-    return pd.DataFrame(rows, columns=['Plate Number', 'Payment Status', 'Entry Timestamp', 'Exit Timestamp', 'Action Type'])
-
 
 def is_vehicle_in_parking(plate_number):
-    cursor.execute("SELECT * FROM plates_log WHERE plate_number = ? ORDER BY entry_timestamp DESC LIMIT 1", (plate_number,))
-    row = cursor.fetchone()
-    if row:
-        return row[4] == 'ENTRY' and (row[3] is None or row[3] == '')
-    return False
+    return is_inside(get_session(conn, plate_number))
 
 
 def get_payment_status(plate_number):
-    cursor.execute("SELECT * FROM plates_log WHERE plate_number = ? AND action_type = 'ENTRY' ORDER BY entry_timestamp DESC LIMIT 1", (plate_number,))
-    entry_row = cursor.fetchone()
-    if entry_row:
-        entry_time = entry_row[2]
-        cursor.execute("SELECT * FROM plates_log WHERE plate_number = ? AND action_type = 'EXIT' AND entry_timestamp = ?", (plate_number, entry_time))
-        exit_row = cursor.fetchone()
-        if exit_row:
-            return None
-        return entry_row[1]
-    return None
-
-
-def validate_entry(plate_number):
-    if is_vehicle_in_parking(plate_number):
-        status = get_payment_status(plate_number)
-        if status == 0:
-            buzz('D')  # Denied access pattern (fast urgent beeps)
-            print("[VALIDATION] DENIED: Vehicle already in parking with unpaid fees")
-            time.sleep(15)  # Sleep after denial buzzer to alert the driver
-            return False, "DENIED: Vehicle already in parking with unpaid fees"
-        elif status == 1:
-            buzz('P')  # Already paid pattern
-            print("[VALIDATION] DENIED: Vehicle already in parking (use EXIT system)")
-            time.sleep(15)  # Optional: also delay after this buzzer
-            return False, "DENIED: Vehicle already in parking (use EXIT system)"
-        else:
-            buzz('D')  # Unknown status - treat as denied
-            print("[VALIDATION] DENIED: Vehicle status unclear")
-            time.sleep(15)  # Sleep here too for unknown status
-            return False, "DENIED: Vehicle status unclear"
-    return True, "APPROVED: Vehicle can enter"
+    """Payment status of the car's current stay, or None if it isn't inside"""
+    session = get_session(conn, plate_number)
+    return session.payment_status if is_inside(session) else None
 
 
 def log_entry(plate_number, payment_status=0):
     timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-    cursor.execute("INSERT INTO plates_log (plate_number, payment_status, entry_timestamp, exit_timestamp, action_type) VALUES (?, ?, ?, ?, ?)",
-                   (plate_number, payment_status, timestamp, '', 'ENTRY'))
-    conn.commit()
-    print(f"[LOGGED] Entry: {plate_number} at {timestamp}")
-
-
-def log_exit(plate_number):
-    timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-    cursor.execute("SELECT * FROM plates_log WHERE plate_number = ? AND action_type = 'ENTRY' AND (exit_timestamp IS NULL OR exit_timestamp = '') ORDER BY entry_timestamp DESC LIMIT 1", (plate_number,))
-    entry_row = cursor.fetchone()
-    if entry_row:
-        cursor.execute("UPDATE plates_log SET exit_timestamp = ? WHERE plate_number = ? AND entry_timestamp = ? AND action_type = 'ENTRY'",
-                       (timestamp, plate_number, entry_row[2]))
+    with conn:  # log row and session commit together
         cursor.execute("INSERT INTO plates_log (plate_number, payment_status, entry_timestamp, exit_timestamp, action_type) VALUES (?, ?, ?, ?, ?)",
-                       (plate_number, entry_row[1], entry_row[2], timestamp, 'EXIT'))
-        conn.commit()
-        print(f"[LOGGED] Exit: {plate_number} at {timestamp}")
-    else:
-        print(f"[ERROR] No entry record found for {plate_number}")
-
-
-def control_gate(action, duration=15):
-    """Optimized gate control with immediate response"""
-    if action == "OPEN":
-        if send_arduino_command('1'):  # Open gate
-            print("[GATE] Opening gate...")
-            time.sleep(duration)  # Keep gate open
-            send_arduino_command('0')  # Close gate
-            print("[GATE] Closing gate...")
-        else:
-            print("[ERROR] Failed to control gate")
+                       (plate_number, payment_status, timestamp, '', 'ENTRY'))
+        open_session(conn, plate_number, cursor.lastrowid, timestamp)
+    log.info("[LOGGED] Entry: %s at %s", plate_number, timestamp)
 
 
 def display_parking_status():
-    df = read_parking_log()
-    unique_plates = df['Plate Number'].unique()
-    in_parking = sum(is_vehicle_in_parking(p) for p in unique_plates)
-    unpaid = sum(get_payment_status(p) == 0 for p in unique_plates if is_vehicle_in_parking(p))
-    print(f"[STATUS] Vehicles in parking: {in_parking}")
-    print(f"[STATUS] Unpaid vehicles: {unpaid}")
+    counters = read_counters(conn)
+    print(f"[STATUS] Vehicles in parking: {counters['occupancy']}"
+          + (f" / {counters['capacity']}" if counters['capacity'] else ""))
+    print(f"[STATUS] Unpaid vehicles: {counters['unpaid']}")
 
 
-def mock_ultrasonic_distance():
-    return random.choice([random.randint(10, 40)] + [random.randint(60, 150)] * 10)
+# ===== Plate Decision =====
+class EntryPolicy(GatePolicy):
+    """Entry gate decisions for one lane: plate voting, validation, gate and buzzer"""
 
+    window_title = 'Entry Webcam Feed'
+    entry_cooldown = 300
+    DENY_RETRY_DELAY = 15  # seconds before a denied plate is re-validated
 
-# ===== Main Loop =====
-cap = cv2.VideoCapture(0)
-plate_buffer = []
-entry_cooldown = 300
-last_saved_plate = None
-last_entry_time = 0
-
-print("[SYSTEM] Smart Parking Entry System Ready")
-display_parking_status()
-
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        break
+    def __init__(self, arduino=None, name='entry'):
+        super().__init__(arduino, name)
+        self.last_saved_plate = None
+        self.last_entry_time = 0
+        self.denied_plates = {}  # {plate: last_denied_timestamp}
 
-    key = cv2.waitKey(1) & 0xFF
-    if key == ord('s'):
+    def show_status(self):
         display_parking_status()
-        continue
-    elif key == ord('q'):
-        break
 
-    distance = mock_ultrasonic_distance()
-    print(f"[SENSOR] Distance: {distance} cm")
-
-    if distance <= 50:
-        results = model(frame)
-        for result in results:
-            for box in result.boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                plate_img = frame[y1:y2, x1:x2]
+    def buzz(self, code):
+        """Queue a buzzer pattern; the Arduino plays it while the lane keeps reading plates"""
+        self.actuators.buzz(code)
+        log.info("[BUZZER] Triggered: %s", code)
+
+    def validate_entry(self, plate_number):
+        with stage_span(self.name, 'db'):
+            inside = is_vehicle_in_parking(plate_number)
+            status = get_payment_status(plate_number) if inside else None
+            full = not inside and is_full(read_counters(conn))
+        if inside:
+            if status == 0:
+                self.buzz('D')  # Denied access pattern (fast urgent beeps)
+                return False, "DENIED: Vehicle already in parking with unpaid fees"
+            elif status == 1:
+                self.buzz('P')  # Already paid pattern
+                return False, "DENIED: Vehicle already in parking (use EXIT system)"
+            else:
+                self.buzz('D')  # Unknown status - treat as denied
+                return False, "DENIED: Vehicle status unclear"
+        if full:
+            self.buzz('D')
+            return False, "DENIED: Parking is full"
+        return True, "APPROVED: Vehicle can enter"
+
+    def control_gate(self, action, duration=15):
+        """Open the gate now and schedule its close, or close it immediately"""
+        if action == "OPEN":
+            self.actuators.open_gate(duration)
+        elif action == "CLOSE":
+            self.actuators.close_gate()
+            log.info("[GATE] Closing gate...")
+
+    def handle_plate(self, plate_candidate, track_id=None, confidences=None, first_seen=None, cached=False):
+        """Vote on a validated plate read and let the car in once its track's vote settles"""
+        log.info("[DETECTED] Plate: %s (track %s)", plate_candidate, track_id)
+        current_time = time.time()
+
+        # The driver was just buzzed; keep reading but don't re-validate yet
+        if current_time - self.denied_plates.get(plate_candidate, 0) < self.DENY_RETRY_DELAY:
+            log.info("[BLOCKED] %s already denied recently.", plate_candidate)
+            return
+
+        most_common = self.vote(track_id, plate_candidate, current_time, confidences, cached)
+        if most_common is None:
+            return
+
+        if most_common != self.last_saved_plate or (current_time - self.last_entry_time) > self.entry_cooldown:
+            can_enter, reason = self.validate_entry(most_common)
+            log.info("[VALIDATION] %s", reason)
+            if can_enter:
+                with stage_span(self.name, 'db'):
+                    log_entry(most_common)
+                self.control_gate("OPEN", duration=15)
+                self.record_decision(True, first_seen)
+                self.last_saved_plate = most_common
+                self.last_entry_time = current_time
+                display_parking_status()
+            else:
+                self.record_decision(False)
+                self.denied_plates[most_common] = current_time
+        else:
+            log.info("[COOLDOWN] Skipped %s", most_common)
 
-                gray = cv2.cvtColor(plate_img, cv2.COLOR_BGR2GRAY)
-                blur = cv2.GaussianBlur(gray, (5, 5), 0)
-                thresh = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
 
-                plate_text = pytesseract.image_to_string(
-                    thresh, config='--psm 8 --oem 3 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-                ).strip().replace(" ", "")
+# ===== Main Loop =====
+def main():
+    parser = argparse.ArgumentParser(description="Entry gate lane")
+    parser.add_argument('--source', default='0',
+                        help="camera index, stream URL, video file, image folder or replay manifest")
+    add_lane_arguments(parser, metrics_port=METRICS_PORT + 1)
+    args = parser.parse_args()
+    start_monitoring(args)
 
-                if "RA" in plate_text:
-                    start_idx = plate_text.find("RA")
-                    plate_candidate = plate_text[start_idx:start_idx + 7]
-                    if len(plate_candidate) == 7:
-                        prefix, digits, suffix = plate_candidate[:3], plate_candidate[3:6], plate_candidate[6]
-                        if prefix.isalpha() and digits.isdigit() and suffix.isalpha():
-                            print(f"[DETECTED] Plate: {plate_candidate}")
-                            plate_buffer.append(plate_candidate)
+    model = YOLO('best3.pt')
+    lane = Lane('entry', open_lane_source(args.source, args), EntryPolicy(connect_arduino(name='entry')),
+                infer=lambda image: model(image, imgsz=DETECT_SIZE, verbose=False)[0], headless=args.headless)
 
-                            if len(plate_buffer) >= 3:
-                                most_common = Counter(plate_buffer).most_common(1)[0][0]
-                                current_time = time.time()
+    print("[SYSTEM] Smart Parking Entry System Ready")
+    display_parking_status()
 
-                                if most_common != last_saved_plate or (current_time - last_entry_time) > entry_cooldown:
-                                    can_enter, reason = validate_entry(most_common)
-                                    print(f"[VALIDATION] {reason}")
-                                    if can_enter:
-                                        log_entry(most_common)
-                                        control_gate("OPEN", duration=15)
-                                        last_saved_plate = most_common
-                                        last_entry_time = current_time
-                                        display_parking_status()
-                                else:
-                                    print(f"[COOLDOWN] Skipped {most_common}")
-                                plate_buffer.clear()
+    run_lanes([lane], headless=args.headless, trace_seconds=args.trace_seconds)
 
-                cv2.imshow("Plate", plate_img)
-                cv2.imshow("Processed", thresh)
-                time.sleep(0.1)  # Reduced sleep time for faster processing
+    print("[SYSTEM] Shutting down...")
+    display_parking_status()
+    conn.close()
 
-    annotated_frame = results[0].plot() if distance <= 50 and 'results' in locals() else frame
-    cv2.imshow('Entry Webcam Feed', annotated_frame)
 
-print("[SYSTEM] Shutting down...")
-cap.release()
-if arduino:
-    arduino.close()
-cv2.destroyAllWindows()
-display_parking_status()
-conn.close()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+from collections import namedtuple
+
+Event = namedtuple('Event', ['seq', 'event_type', 'source', 'row_id', 'plate_number', 'created_at'])
+EVENT_COLUMNS = ', '.join(Event._fields)
+
+
+def latest_seq(conn):
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM parking_events").fetchone()[0]
+
+
+class ChangeFeed:
+    """Tails parking_events from a sequence number onwards.
+
+    PRAGMA data_version only changes when another connection commits, so
+    an idle poll costs one pragma and no table access; the events query
+    itself is a range scan on the primary key past the cursor.
+    """
+
+    def __init__(self, conn, after_seq=None, batch_size=500):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.seq = latest_seq(conn) if after_seq is None else after_seq
+        self._data_version = None
+
+    def changed(self):
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return False
+        self._data_version = data_version
+        return True
+
+    def poll(self):
+        """Return the events committed since the last poll, oldest first"""
+        if not self.changed():
+            return []
+        events = []
+        while True:
+            rows = self.conn.execute(f"SELECT {EVENT_COLUMNS} FROM parking_events WHERE seq > ? ORDER BY seq LIMIT ?",
+                                     (self.seq, self.batch_size)).fetchall()
+            events.extend(Event(*row) for row in rows)
+            if rows:
+                self.seq = events[-1].seq
+            if len(rows) < self.batch_size:
+                return events
@@ -1,9 +1,9 @@
 import cv2
 from ultralytics import YOLO
-import pytesseract
 import os
 import time
-import re
+from ocr_service import OcrService
+from plate_consensus import correct_plate
 
 # Load YOLOv8 model (update path if needed)
 model = YOLO('/best3.pt')
@@ -16,6 +16,9 @@ os.makedirs(save_dir, exist_ok=True)
 cap = cv2.VideoCapture(0)
 plate_count = 0
 
+# Keeps tesseract loaded between crops instead of spawning it per plate
+ocr = OcrService(workers=1)
+
 while True:
     ret, frame = cap.read()
     if not ret:
@@ -42,31 +45,12 @@ while True:
             thresh = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
 
             # ===== OCR Extraction =====
-            plate_text = pytesseract.image_to_string(
-                thresh,
-                config='--psm 8 --oem 3 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-            ).strip()
-
-            # ===== Validation Logic with 8th Char Tolerance =====
-            match = re.search(r'RA[A-Z0-9 ]*', plate_text.upper())
-            if match:
-                plate_candidate = match.group()
-                plate_clean = plate_candidate.replace(" ", "")
-
-                if len(plate_clean) == 8:
-                    plate_clean = plate_clean[:7]  # Trim extra char
-
-                if len(plate_clean) == 7:
-                    first_three = plate_clean[:3]
-                    digits_part = plate_clean[3:6]
-                    last_char = plate_clean[6]
-
-                    if first_three.isalpha() and digits_part.isdigit() and last_char.isalpha():
-                        print(f"✅ Valid Plate: {plate_clean}")
-                    else:
-                        print(f"❌ Invalid Format: {plate_clean}")
-                else:
-                    print(f"❌ Incorrect Length after cleaning: {plate_clean}")
+            plate_text, confidences, _ = ocr.read_thresholded(thresh)
+
+            # ===== Validation: the lanes' plate grammar and O/0, I/1, B/8 correction =====
+            plate, _ = correct_plate(plate_text, confidences)
+            if plate:
+                print(f"✅ Valid Plate: {plate}")
             else:
                 print(f"❌ No valid RA plate found in: '{plate_text}'")
 
@@ -83,4 +67,5 @@ while True:
         break
 
 cap.release()
+ocr.close()
 cv2.destroyAllWindows()
\ No newline at end of file
@@ -1,8 +1,8 @@
 import cv2
 from ultralytics import YOLO
-import pytesseract
 import os
 import time
+from ocr_service import OcrService
 
 # Load YOLOv8 model
 model = YOLO('best3.pt')  # Absolute path to your best weights
@@ -16,6 +16,9 @@ cap = cv2.VideoCapture(0)
 
 plate_count = 0  # Counter for saved plates
 
+# Keeps tesseract loaded between crops instead of spawning it per plate
+ocr = OcrService(workers=1)
+
 while True:
     ret, frame = cap.read()
     if not ret:
@@ -44,7 +47,7 @@ while True:
             thresh = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
 
             # ===== OCR Extraction =====
-            plate_text = pytesseract.image_to_string(thresh, config='--psm 8 --oem 3 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789')
+            plate_text = ocr.read_text(thresh)
 
             print(f"[INFO] Extracted Plate Number: {plate_text.strip()}")
 
@@ -62,4 +65,5 @@ while True:
         break
 
 cap.release()
+ocr.close()
 cv2.destroyAllWindows()
\ No newline at end of file
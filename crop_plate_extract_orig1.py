@@ -1,8 +1,8 @@
 import cv2
 from ultralytics import YOLO
-import pytesseract
 import os
 import time
+from ocr_service import OcrService
 import re
 
 # Load YOLOv8 model (update path if needed)
@@ -16,6 +16,9 @@ os.makedirs(save_dir, exist_ok=True)
 cap = cv2.VideoCapture(0)
 plate_count = 0
 
+# Keeps tesseract loaded between crops instead of spawning it per plate
+ocr = OcrService(workers=1)
+
 while True:
     ret, frame = cap.read()
     if not ret:
@@ -42,10 +45,7 @@ while True:
             thresh = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
 
             # ===== OCR Extraction =====
-            plate_text = pytesseract.image_to_string(
-                thresh,
-                config='--psm 8 --oem 3 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-            ).strip()
+            plate_text = ocr.read_text(thresh)
 
             # ===== Validation Logic =====
             match = re.search(r'RA[A-Z0-9 ]*', plate_text.upper())
@@ -80,4 +80,5 @@ while True:
         break
 
 cap.release()
+ocr.close()
 cv2.destroyAllWindows()
\ No newline at end of file
@@ -1,47 +1,56 @@
-import os
+import hashlib
+import json
+import logging
 import sqlite3
 import threading
 import time
-from flask import Flask, render_template, jsonify
-from flask_socketio import SocketIO
+from flask import Flask, Response, g, render_template, jsonify, request
+from flask_socketio import SocketIO, emit
+import parking_db
+from change_feed import ChangeFeed, latest_seq
+from parking_sessions import read_counters
+from history import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, decode_cursor, iter_page
+from rollups import ROLLUPS, query_rollups, last_24_hours, revenue_on
+from export import EXPORT_TABLES, ExportError, export_stream
+from lane_log import setup_logging
+import metrics
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key'
 socketio = SocketIO(app, cors_allowed_origins="*")
 
-# Ensure the data directory exists
-os.makedirs(os.path.dirname('data/parking.db'), exist_ok=True)
+CHANGE_CHECK_INTERVAL = 0.05  # seconds between PRAGMA data_version checks
+
+log = logging.getLogger('dashboard')
+REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    'parking_dashboard_request_seconds', "Dashboard HTTP request latency", ('endpoint', 'status'))
+CLIENTS = metrics.REGISTRY.gauge('parking_dashboard_clients', "Connected dashboard sockets")
+DELTAS = metrics.REGISTRY.counter('parking_dashboard_deltas_total', "Deltas broadcast to dashboards", ('type',))
+FEED_SEQ = metrics.REGISTRY.gauge('parking_dashboard_feed_seq', "Last change-feed sequence number broadcast")
+SNAPSHOT_REBUILDS = metrics.REGISTRY.counter('parking_dashboard_snapshot_rebuilds_total', "Dashboard snapshot rebuilds")
+PARKING = metrics.REGISTRY.gauge('parking_vehicles', "Vehicles inside, by payment state", ('state',))
+CAPACITY = metrics.REGISTRY.gauge('parking_capacity', "Configured capacity, 0 meaning unlimited")
 
 def get_db_connection():
-    conn = sqlite3.connect('data/parking.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    # uri=True so history queries can attach archive files read-only
+    return parking_db.connect(row_factory=sqlite3.Row, upgrade=False, uri=True)
 
 def create_tables():
-    """Ensure all required tables exist."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            plate_number TEXT,
-            entry_time TEXT,
-            exit_time TEXT,
-            duration_hr REAL,
-            amount INTEGER,
-            payment_status INTEGER
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS plates_log (
-            plate_number TEXT,
-            payment_status INTEGER,
-            entry_timestamp TEXT,
-            exit_timestamp TEXT,
-            action_type TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    """Ensure the schema is at the latest version."""
+    parking_db.connect().close()
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    if hasattr(g, 'request_started'):
+        # Streamed responses are timed to their first byte
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_started,
+                                endpoint=request.url_rule.rule if request.url_rule else 'unmatched',
+                                status=response.status_code)
+    return response
 
 @app.route('/')
 def index():
@@ -49,197 +58,276 @@ def index():
 
 @app.route('/api/dashboard_data')
 def dashboard_data():
-    create_tables()  # Ensure tables exist
-
+    _, body, etag = snapshot_cache.get()
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)  # 304 when If-None-Match still matches
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text exposition; occupancy is read from the counters at scrape time."""
     conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Get current parking status
-    cursor.execute('''
-        SELECT 
-            COUNT(*) as total_vehicles,
-            SUM(CASE WHEN payment_status = 0 THEN 1 ELSE 0 END) as unpaid_vehicles,
-            SUM(CASE WHEN payment_status = 1 THEN 1 ELSE 0 END) as paid_vehicles
-        FROM plates_log
-    ''')
-    parking_status = dict(cursor.fetchone())
-
-    # Get today's revenue
-    cursor.execute('''
-        SELECT COALESCE(SUM(amount), 0) as today_revenue
-        FROM transactions
-        WHERE date(exit_time) = date('now')
-    ''')
-    today_revenue = dict(cursor.fetchone())
-
-    # Get recent transactions
-    cursor.execute('''
-        SELECT DISTINCT t.*, p.plate_number
-        FROM transactions t
-        JOIN plates_log p ON t.plate_number = p.plate_number
-        ORDER BY t.exit_time DESC
-        LIMIT 10
-    ''')
-    recent_transactions = [dict(row) for row in cursor.fetchall()]
-
-    # Get unauthorized exit attempts
-    cursor.execute('''
-        SELECT plate_number, entry_timestamp, exit_timestamp, action_type
-        FROM plates_log
-        WHERE action_type = 'UNAUTHORIZED_EXIT'
-        ORDER BY exit_timestamp DESC
-        LIMIT 10
-    ''')
-    unauthorized_exits = [dict(row) for row in cursor.fetchall()]
-
-    # Get hourly statistics for the last 24 hours
-    cursor.execute('''
-        SELECT 
-            strftime('%H', entry_timestamp) as hour,
-            COUNT(*) as entries
-        FROM plates_log
-        WHERE entry_timestamp >= datetime('now', '-24 hours')
-        GROUP BY hour
-        ORDER BY hour
-    ''')
-    hourly_stats = [dict(row) for row in cursor.fetchall()]
-
-    # Complete 24-hour dataset
-    complete_hourly_stats = []
-    for hour in range(24):
-        hour_str = f"{hour:02d}"
-        hour_data = next((stat for stat in hourly_stats if stat['hour'] == hour_str), None)
-        complete_hourly_stats.append({
-            'hour': hour_str,
-            'entries': hour_data['entries'] if hour_data else 0
-        })
-
-    conn.close()
-
-    return jsonify({
-        'parking_status': parking_status,
-        'today_revenue': today_revenue,
-        'recent_transactions': recent_transactions,
-        'unauthorized_exits': unauthorized_exits,
-        'hourly_stats': complete_hourly_stats
-    })
-
-def monitor_database_changes():
-    """Monitor database for changes and emit updates."""
-    create_tables()  # Ensure tables exist
-
-    last_check = None
+    try:
+        counters = read_counters(conn)
+    finally:
+        conn.close()
+    PARKING.set(counters['occupancy'] - counters['unpaid'], state='paid')
+    PARKING.set(counters['unpaid'], state='unpaid')
+    CAPACITY.set(counters['capacity'])
+    return Response(metrics.REGISTRY.expose(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/stats')
+def stats():
+    """Hourly or daily rollups for any range: ?granularity=hour|day&from=2025-06-01&to=2025-07-01"""
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in ROLLUPS:
+        return jsonify({'error': f"granularity must be one of {', '.join(ROLLUPS)}"}), 400
+    conn = get_db_connection()
+    try:
+        rows = query_rollups(conn, granularity, request.args.get('from'), request.args.get('to'))
+    finally:
+        conn.close()
+    return jsonify({'granularity': granularity, 'stats': rows})
 
-    while True:
+def stream_history(source, filters):
+    """Stream one keyset page as JSON: {"items": [...], "next_cursor": token or null}"""
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        if cursor:
+            decode_cursor(cursor)
+    except (ValueError, InvalidCursor) as e:
+        return jsonify({'error': str(e)}), 400
+    start, end = request.args.get('from'), request.args.get('to')
+
+    def generate():
         conn = get_db_connection()
-        cursor = conn.cursor()
-
         try:
-            cursor.execute('''
-                SELECT 
-                    MAX(exit_timestamp) as last_exit,
-                    MAX(entry_timestamp) as last_entry,
-                    (SELECT COUNT(*) FROM plates_log WHERE action_type = 'UNAUTHORIZED_EXIT') as unauthorized_count,
-                    (SELECT MAX(exit_time) FROM transactions) as last_transaction
-                FROM plates_log
-            ''')
-            result = cursor.fetchone()
-
-            current_state = (
-                result['last_exit'] or '',
-                result['last_entry'] or '',
-                result['unauthorized_count'] or 0,
-                result['last_transaction'] or ''
-            )
-
-            if last_check is None or current_state != last_check:
-                print(f"[DEBUG] Database change detected: {current_state}")
-                emit_parking_update()
-                last_check = current_state
-
-        except sqlite3.OperationalError as e:
-            print(f"[ERROR] Database operation failed: {e}")
-
+            yield '{"items": ['
+            first = True
+            for row, next_cursor in iter_page(conn, source, filters, start, end, cursor, limit):
+                if row is None:
+                    yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+                    break
+                yield ('' if first else ', ') + json.dumps(row)
+                first = False
         finally:
             conn.close()
 
-        time.sleep(0.5)
+    return Response(generate(), mimetype='application/json')
 
-def emit_parking_update():
-    """Emit real-time parking updates to connected clients."""
+@app.route('/api/transactions')
+def transactions():
+    """Payments, newest first: ?plate=&from=&to=&limit=&cursor="""
+    return stream_history('transactions', {'plate': request.args.get('plate')})
+
+@app.route('/api/events')
+def events():
+    """Plate log rows, newest first: ?plate=&action=ENTRY|EXIT|UNAUTHORIZED_EXIT&from=&to=&limit=&cursor="""
+    return stream_history('events', {'plate': request.args.get('plate'), 'action': request.args.get('action')})
+
+@app.route('/api/export/<table>')
+def export(table):
+    """Download a whole table as it streams: ?format=csv|parquet&from=2025-01-01&to=2026-01-01"""
+    fmt = request.args.get('format', 'csv')
+    if table not in EXPORT_TABLES:
+        return jsonify({'error': f"table must be one of {', '.join(EXPORT_TABLES)}"}), 404
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        stream = export_stream(parking_db.DB_FILE, table, fmt, request.args.get('from'), request.args.get('to'))
+    except ExportError as e:
+        return jsonify({'error': str(e)}), 400
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/vnd.apache.parquet'
+    headers = {'Content-Disposition': f'attachment; filename="{table}.{fmt}"'}
+    return Response(stream, mimetype=mimetype, headers=headers)
+
+ACTIVITY_COLUMNS = "id, plate_number, entry_timestamp, exit_timestamp, action_type, payment_status"
+TRANSACTION_COLUMNS = "id, plate_number, entry_time, exit_time, duration_hr, amount, payment_status"
+LIST_LIMIT = 10  # items per dashboard list
+
+def query_today_revenue(conn):
+    return {'today_revenue': revenue_on(conn)}
+
+def query_current_count(conn):
+    counters = read_counters(conn)
+    return {'current_count': counters['occupancy'], 'unpaid_count': counters['unpaid'],
+            'capacity': counters['capacity']}
+
+def build_snapshot(conn):
+    """Full dashboard state as of one change-feed sequence number."""
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")  # one read transaction, so the data matches seq
+    try:
+        seq = latest_seq(conn)
 
-        cursor.execute('''
-            SELECT plate_number, entry_timestamp, exit_timestamp, action_type, payment_status
+        cursor.execute(f'''
+            SELECT {ACTIVITY_COLUMNS}
             FROM plates_log
+            WHERE action_type IN ('ENTRY', 'EXIT')
             ORDER BY entry_timestamp DESC
-            LIMIT 1
-        ''')
-        latest_activity = dict(cursor.fetchone() or {})
-
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as current_count,
-                SUM(CASE WHEN payment_status = 0 THEN 1 ELSE 0 END) as unpaid_count
-            FROM plates_log
-            WHERE (exit_timestamp IS NULL OR exit_timestamp = '')
-            AND action_type = 'ENTRY'
-        ''')
-        current_count = dict(cursor.fetchone() or {})
+            LIMIT ?
+        ''', (LIST_LIMIT,))
+        recent_activity = [dict(row) for row in cursor.fetchall()]
 
-        cursor.execute('''
-            SELECT plate_number, entry_timestamp, exit_timestamp, action_type
+        cursor.execute(f'''
+            SELECT {ACTIVITY_COLUMNS}
             FROM plates_log
             WHERE action_type = 'UNAUTHORIZED_EXIT'
             ORDER BY exit_timestamp DESC
-            LIMIT 10
-        ''')
+            LIMIT ?
+        ''', (LIST_LIMIT,))
         unauthorized_exits = [dict(row) for row in cursor.fetchall()]
 
-        cursor.execute('''
-            SELECT COALESCE(SUM(amount), 0) as today_revenue
+        cursor.execute(f'''
+            SELECT {TRANSACTION_COLUMNS}
             FROM transactions
-            WHERE date(exit_time) = date('now')
-        ''')
-        today_revenue = dict(cursor.fetchone() or {})
-
-        cursor.execute('''
-            SELECT DISTINCT t.*, p.plate_number
-            FROM transactions t
-            JOIN plates_log p ON t.plate_number = p.plate_number
-            ORDER BY t.exit_time DESC
-            LIMIT 10
-        ''')
+            ORDER BY exit_time DESC
+            LIMIT ?
+        ''', (LIST_LIMIT,))
         recent_transactions = [dict(row) for row in cursor.fetchall()]
 
-        update_data = {
-            'latest_activity': latest_activity,
-            'current_count': current_count,
+        return {
+            'seq': seq,
+            'current_count': query_current_count(conn),
+            'today_revenue': query_today_revenue(conn),
+            'recent_activity': recent_activity,
             'unauthorized_exits': unauthorized_exits,
-            'today_revenue': today_revenue,
-            'recent_transactions': recent_transactions
+            'recent_transactions': recent_transactions,
+            'hourly_stats': last_24_hours(conn),
         }
+    finally:
+        conn.commit()
+
+def build_deltas(conn, events):
+    """Turn change-feed events into typed dashboard deltas: entry, exit, paid, payment, unauthorized, counts."""
+    deltas = []
+    sessions_changed = False
+    for event in events:
+        if event.source == 'parking_sessions':
+            sessions_changed = True
+            continue
+        if event.source == 'transactions':
+            row = conn.execute(f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE id = ?",
+                               (event.row_id,)).fetchone()
+            if row:
+                deltas.append({'seq': event.seq, 'type': 'payment', 'transaction': dict(row),
+                               'today_revenue': query_today_revenue(conn)})
+            continue
+
+        row = conn.execute(f"SELECT {ACTIVITY_COLUMNS} FROM plates_log WHERE id = ?", (event.row_id,)).fetchone()
+        if row is None:
+            continue
+        row = dict(row)
+        if row['action_type'] == 'UNAUTHORIZED_EXIT':
+            deltas.append({'seq': event.seq, 'type': 'unauthorized', 'exit': row})
+        elif event.event_type == 'ENTRY':
+            deltas.append({'seq': event.seq, 'type': 'entry', 'activity': row})
+        elif row['action_type'] == 'EXIT':
+            # The exit gate turning the ENTRY row into EXIT (the kiosk did, before), or an older EXIT row
+            deltas.append({'seq': event.seq, 'type': 'exit', 'activity': row})
+        elif row['action_type'] == 'ENTRY' and event.event_type == 'LOG_UPDATE':
+            # The kiosk marking the stay paid; the client updates the row it already shows
+            deltas.append({'seq': event.seq, 'type': 'paid', 'activity': row})
+
+    if sessions_changed:
+        deltas.append({'seq': events[-1].seq, 'type': 'counts', 'current_count': query_current_count(conn)})
+    return deltas
+
+class SnapshotCache:
+    """The dashboard snapshot, built once and shared by every client and request.
+
+    The change-feed monitor invalidates it; the next reader rebuilds it under
+    the lock, so a wall of screens reconnecting together costs one rebuild.
+    max_age bounds how long the time-based parts (today's revenue, the last
+    24 hours) can go stale while nothing is written.
+    """
+
+    def __init__(self, max_age=60):
+        self.max_age = max_age
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+        self._stale = True
+        self._built_at = 0.0
+        self._entry = None  # (snapshot, json body, etag)
+
+    def invalidate(self):
+        self._stale = True
+
+    def get(self):
+        with self._lock:
+            if self._stale or time.monotonic() - self._built_at > self.max_age:
+                self._stale = False  # cleared first so a change during the build marks it again
+                conn = get_db_connection()
+                try:
+                    snapshot = build_snapshot(conn)
+                finally:
+                    conn.close()
+                body = json.dumps(snapshot)
+                self._entry = (snapshot, body, hashlib.sha1(body.encode()).hexdigest())
+                self._built_at = time.monotonic()
+                self.rebuilds += 1
+            return self._entry
+
+snapshot_cache = SnapshotCache()
+SNAPSHOT_REBUILDS.set_function(lambda: snapshot_cache.rebuilds)
+
+def monitor_database_changes():
+    """Tail the change feed and broadcast each batch of changes as deltas."""
+    create_tables()  # Ensure tables exist
+
+    conn = get_db_connection()
+    feed = ChangeFeed(conn)
 
-        print(f"[DEBUG] Emitting update: {update_data}")
-        socketio.emit('parking_update', update_data)
+    while True:
+        try:
+            prev_seq = feed.seq
+            events = feed.poll()
+            if events:
+                snapshot_cache.invalidate()
+                emit_parking_delta(conn, prev_seq, events)
+                FEED_SEQ.set(feed.seq)
+
+        except sqlite3.OperationalError as e:
+            log.error("[ERROR] Database operation failed: %s", e)
+
+        time.sleep(CHANGE_CHECK_INTERVAL)
+
+def emit_parking_delta(conn, prev_seq, events):
+    """Broadcast one batch; clients apply it only if prev_seq is the last seq they hold."""
+    try:
+        batch = {'seq': events[-1].seq, 'prev_seq': prev_seq, 'deltas': build_deltas(conn, events)}
+        log.debug("[DEBUG] Emitting %d delta(s) for seq %d..%d", len(batch['deltas']), prev_seq + 1, batch['seq'])
+        socketio.emit('parking_delta', batch)
+        for delta in batch['deltas']:
+            DELTAS.inc(type=delta['type'])
+    except Exception as e:
+        log.error("[ERROR] Failed to emit update: %s", e)
 
+def emit_parking_snapshot():
+    """Send the cached dashboard state to the requesting client only."""
+    try:
+        snapshot, _, _ = snapshot_cache.get()
+        emit('parking_snapshot', snapshot)
     except Exception as e:
-        print(f"[ERROR] Failed to emit update: {e}")
-    finally:
-        conn.close()
+        log.error("[ERROR] Failed to send snapshot: %s", e)
 
 @socketio.on('connect')
 def handle_connect():
-    print("[DEBUG] New client connected")
-    emit_parking_update()
+    log.debug("[DEBUG] New client connected")
+    CLIENTS.inc()
+    emit_parking_snapshot()
+
+@socketio.on('resync')
+def handle_resync():
+    log.debug("[DEBUG] Client requested resync")
+    emit_parking_snapshot()
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print("[DEBUG] Client disconnected")
+    log.debug("[DEBUG] Client disconnected")
+    CLIENTS.dec()
 
 if __name__ == '__main__':
+    setup_logging()
     create_tables()  # Ensure tables exist at startup
 
     monitor_thread = threading.Thread(target=monitor_database_changes, daemon=True)
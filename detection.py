@@ -0,0 +1,95 @@
+import json
+
+import cv2
+import numpy as np
+
+DETECT_SIZE = 640  # side of the letterboxed square the detector sees
+PAD_VALUE = 114  # ultralytics' own letterbox grey
+
+
+def result_boxes(result):
+    """Integer (x1, y1, x2, y2) boxes from an ultralytics Results, skipping empty ones"""
+    boxes = []
+    for box in result.boxes:
+        x1, y1, x2, y2 = map(int, box.xyxy[0])
+        if x2 > x1 and y2 > y1:
+            boxes.append((x1, y1, x2, y2))
+    return boxes
+
+
+def letterbox(frame, size):
+    """Downscale frame to fit a size x size square, padding the rest.
+
+    Returns (image, scale, (pad_x, pad_y)); frames already smaller than the
+    square are padded, never upscaled.
+    """
+    height, width = frame.shape[:2]
+    scale = min(size / width, size / height, 1.0)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    resized = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_AREA) if scale < 1.0 else frame
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+    image = cv2.copyMakeBorder(resized, pad_y, size - new_h - pad_y, pad_x, size - new_w - pad_x,
+                               cv2.BORDER_CONSTANT, value=(PAD_VALUE, PAD_VALUE, PAD_VALUE))
+    return image, scale, (pad_x, pad_y)
+
+
+class RoiMask:
+    """Image areas where plates can appear at a gate, as polygons in
+    coordinates normalised to 0..1 of the frame width and height"""
+
+    def __init__(self, polygons):
+        self.polygons = [np.array(polygon, dtype=np.float32) for polygon in polygons]
+        self._masks = {}  # {(size, frame shape): mask in letterboxed coordinates}
+
+    @classmethod
+    def load(cls, path, lane_name):
+        """Read the polygons for lane_name from a JSON file of {lane name: [polygon, ...]}"""
+        with open(path) as f:
+            polygons = json.load(f).get(lane_name)
+        return cls(polygons) if polygons else None
+
+    def mask_for(self, frame_shape, size, scale, pad):
+        key = (size, frame_shape[:2])
+        if key not in self._masks:
+            height, width = frame_shape[:2]
+            mask = np.zeros((size, size), dtype=np.uint8)
+            for polygon in self.polygons:
+                points = polygon * np.array([width, height], dtype=np.float32) * scale + np.array(pad)
+                cv2.fillPoly(mask, [points.round().astype(np.int32)], 255)
+            self._masks[key] = mask
+        return self._masks[key]
+
+
+class ScaledDetector:
+    """Runs the detector on a letterboxed downscale of the frame and maps its
+    boxes back to native resolution, so crops for OCR keep full detail.
+
+    With an RoiMask, everything outside the gate's plate area is greyed out
+    before inference and boxes centred outside it are dropped.
+    """
+
+    def __init__(self, infer, size=DETECT_SIZE, roi=None):
+        self.infer = infer  # letterboxed image -> ultralytics Results, or None
+        self.size = size
+        self.roi = roi
+
+    def __call__(self, frame):
+        """Return native-resolution boxes for frame, or None if the detector stopped"""
+        image, scale, (pad_x, pad_y) = letterbox(frame, self.size)
+        mask = None
+        if self.roi:
+            mask = self.roi.mask_for(frame.shape, self.size, scale, (pad_x, pad_y))
+            image[mask == 0] = PAD_VALUE
+
+        result = self.infer(image)
+        if result is None:
+            return None
+
+        height, width = frame.shape[:2]
+        boxes = []
+        for x1, y1, x2, y2 in result_boxes(result):
+            if mask is not None and not mask[min((y1 + y2) // 2, self.size - 1), min((x1 + x2) // 2, self.size - 1)]:
+                continue
+            boxes.append((max(0, int((x1 - pad_x) / scale)), max(0, int((y1 - pad_y) / scale)),
+                          min(width, int(round((x2 - pad_x) / scale))), min(height, int(round((y2 - pad_y) / scale)))))
+        return [box for box in boxes if box[2] > box[0] and box[3] > box[1]]
@@ -0,0 +1,202 @@
+import argparse
+import csv
+import io
+import sqlite3
+import sys
+
+import parking_db
+from archive import ARCHIVE_TABLES, archive_months, archive_path
+from rollups import ROLLUP_COLUMNS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional; CSV needs nothing extra
+    pa = None
+
+EXPORT_CHUNK_SIZE = 5000  # rows held in memory at a time
+EXPORT_FORMATS = ('csv', 'parquet')
+
+_ROLLUP_TYPES = dict({'bucket': 'text'}, **{column: 'real' if column == 'stay_seconds' else 'integer'
+                                             for column in ROLLUP_COLUMNS})
+# {name: (time column used by --from/--to, {column: type})}
+EXPORT_TABLES = {
+    'plates_log': ('entry_timestamp', {'id': 'integer', 'plate_number': 'text', 'payment_status': 'integer',
+                                       'entry_timestamp': 'text', 'exit_timestamp': 'text', 'action_type': 'text'}),
+    'transactions': ('exit_time', {'id': 'integer', 'plate_number': 'text', 'entry_time': 'text',
+                                   'exit_time': 'text', 'duration_hr': 'real', 'amount': 'integer',
+                                   'payment_status': 'integer'}),
+    'stats_hourly': ('bucket', _ROLLUP_TYPES),
+    'stats_daily': ('bucket', _ROLLUP_TYPES),
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def export_columns(table):
+    return tuple(EXPORT_TABLES[table][1])
+
+
+def _query(table, start, end):
+    time_column, columns = EXPORT_TABLES[table]
+    where, params = [], []
+    if start:
+        where.append(f"{time_column} >= ?")
+        params.append(start)
+    if end:
+        where.append(f"{time_column} < ?")
+        params.append(end)
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + f" ORDER BY {time_column}", params
+
+
+def _chunks(conn, table, start, end, chunk_size):
+    cursor = conn.execute(*_query(table, start, end))
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+
+def iter_chunks(db_file, table, start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of at most chunk_size rows: archived months in range first, then the live database.
+
+    The live read transaction is opened, and its snapshot taken, before the
+    archives are listed and read, so the export is the live snapshot plus
+    whatever had been archived by then. A row archived while the export runs
+    is in that snapshot as well as in its archive; it is skipped in the
+    archive, so no row is exported twice or lost to a concurrent archive.py.
+    """
+    if table not in EXPORT_TABLES:
+        raise ExportError(f"Unknown table {table}; choose from {', '.join(EXPORT_TABLES)}")
+
+    conn = parking_db.connect(db_file, upgrade=False)
+    try:
+        conn.execute("BEGIN")
+        conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchall()  # a deferred BEGIN snapshots on its first read
+        if table in ARCHIVE_TABLES:
+            id_index = export_columns(table).index('id')
+            for month in sorted(archive_months(db_file)):
+                if (start and month < start[:7]) or (end and month > end[:7]):
+                    continue
+                archive = sqlite3.connect(f"file:{archive_path(db_file, month)}?mode=ro", uri=True)
+                try:
+                    for rows in _chunks(archive, table, start, end, chunk_size):
+                        ids = [row[id_index] for row in rows]
+                        live = {row_id for row_id, in conn.execute(
+                            f"SELECT id FROM {table} WHERE id IN ({', '.join('?' * len(ids))})", ids)}
+                        rows = [row for row in rows if row[id_index] not in live] if live else rows
+                        if rows:
+                            yield rows
+                finally:
+                    archive.close()
+
+        yield from _chunks(conn, table, start, end, chunk_size)
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def csv_stream(table, chunks):
+    """Yield CSV text, one piece per chunk, header first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(export_columns(table))
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _StreamSink(io.RawIOBase):
+    """Write-only file that hands out whatever was written since the last drain"""
+
+    def __init__(self):
+        self._pieces = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._pieces.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data, self._pieces = b''.join(self._pieces), []
+        return data
+
+
+def parquet_schema(table):
+    types = {'integer': pa.int64(), 'real': pa.float64(), 'text': pa.string()}
+    return pa.schema([(column, types[kind]) for column, kind in EXPORT_TABLES[table][1].items()])
+
+
+def parquet_stream(table, chunks):
+    """Yield a Parquet file in pieces, one row group per chunk"""
+    if pa is None:
+        raise ExportError("Parquet export needs pyarrow (pip install pyarrow)")
+    schema = parquet_schema(table)
+    columns = export_columns(table)
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    try:
+        for rows in chunks:
+            arrays = {column: [row[i] for row in rows] for i, column in enumerate(columns)}
+            writer.write_table(pa.Table.from_pydict(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_stream(db_file, table, fmt='csv', start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown format {fmt}; choose from {', '.join(EXPORT_FORMATS)}")
+    if fmt == 'parquet' and pa is None:
+        raise ExportError("Parquet export needs pyarrow (pip install pyarrow)")
+    chunks = iter_chunks(db_file, table, start, end, chunk_size)
+    return csv_stream(table, chunks) if fmt == 'csv' else parquet_stream(table, chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream parking data to CSV or Parquet")
+    parser.add_argument('table', choices=tuple(EXPORT_TABLES))
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('--from', dest='start', help="inclusive lower bound, e.g. 2025-01-01")
+    parser.add_argument('--to', dest='end', help="exclusive upper bound, e.g. 2026-01-01")
+    parser.add_argument('--output', '-o', help="file to write (CSV defaults to stdout)")
+    parser.add_argument('--db', default=parking_db.DB_FILE)
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if args.format == 'parquet' and not args.output:
+        parser.error("--output is required for parquet")
+    try:
+        stream = export_stream(args.db, args.table, args.format, args.start, args.end, args.chunk_size)
+        if args.output:
+            mode, encoding = ('w', 'utf-8') if args.format == 'csv' else ('wb', None)
+            with open(args.output, mode, encoding=encoding, newline='' if encoding else None) as f:
+                for piece in stream:
+                    f.write(piece)
+            print(f"[EXPORT] {args.table} written to {args.output}", file=sys.stderr)
+        else:
+            for piece in stream:
+                sys.stdout.write(piece)
+    except ExportError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import csv
+import glob
+import logging
+import os
+import re
+import time
+from datetime import datetime
+
+import cv2
+
+PACING_MODES = ('realtime', 'max')  # replay at recorded speed, or as fast as the lane can take frames
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+IMAGE_FOLDER_FPS = 10.0  # frame rate assumed for folders without timestamps
+# car_20250324_104717.jpg, optionally with milliseconds: car_20250324_104717_250.jpg
+TIMESTAMP_PATTERN = re.compile(r'(\d{8})_(\d{6})(?:_(\d{1,6}))?')
+
+log = logging.getLogger(__name__)
+
+
+class Pacer:
+    """Maps recorded frame times onto the wall clock.
+
+    In realtime mode stamp() sleeps until a frame's recorded offset has
+    elapsed; in max mode it never sleeps. Either way frames are stamped with
+    start time + recorded offset, so tracking and voting see the spacing
+    the camera produced rather than how fast the replay happens to run.
+    """
+
+    def __init__(self, mode='realtime'):
+        if mode not in PACING_MODES:
+            raise ValueError(f"pacing must be one of {', '.join(PACING_MODES)}, got '{mode}'")
+        self.mode = mode
+        self._wall_start = None
+        self._media_start = None
+
+    def stamp(self, media_time):
+        """Wait if pacing in real time, then return the frame's capture timestamp"""
+        if self._wall_start is None:
+            self._wall_start, self._media_start = time.time(), media_time
+        timestamp = self._wall_start + (media_time - self._media_start)
+        if self.mode == 'realtime':
+            delay = timestamp - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        return timestamp
+
+
+class FrameSource:
+    """Where a lane's frames come from.
+
+    read() returns (timestamp, image), or None once the source is finished.
+    Live sources behave like a camera and the lane may drop frames it can't
+    keep up with; the others are replays, and at max pacing the lane waits
+    for them instead so every recorded frame is processed.
+    """
+
+    live = True
+    description = 'source'
+
+    def read(self):
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+    def __str__(self):
+        return self.description
+
+
+class CameraSource(FrameSource):
+    """A webcam index or a network stream URL, read through cv2.VideoCapture"""
+
+    def __init__(self, device=0):
+        self.description = f"camera {device}"
+        self.cap = cv2.VideoCapture(device)
+
+    def read(self):
+        ret, image = self.cap.read()
+        return (time.time(), image) if ret else None
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource(FrameSource):
+    """A recorded video file, paced by its own frame timestamps"""
+
+    def __init__(self, path, pace='realtime', loop=False):
+        self.description = f"video {path}"
+        self.path = path
+        self.loop = loop
+        self.pacer = Pacer(pace)
+        self.live = pace == 'realtime'
+        self.cap = cv2.VideoCapture(path)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or IMAGE_FOLDER_FPS
+        self._frame_index = 0
+        self._offset = 0.0  # media time of the start of the current loop
+
+    def read(self):
+        ret, image = self.cap.read()
+        if not ret and self.loop and self._frame_index:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self._offset += self._frame_index / self.fps
+            self._frame_index = 0
+            ret, image = self.cap.read()
+        if not ret:
+            return None
+        media_time = self._offset + self._frame_index / self.fps
+        self._frame_index += 1
+        return self.pacer.stamp(media_time), image
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageFolderSource(FrameSource):
+    """Images in name order, each shown at its own time.
+
+    times holds each image's recorded offset in seconds; without it the
+    images are spaced 1/fps apart.
+    """
+
+    def __init__(self, paths, pace='realtime', loop=False, fps=IMAGE_FOLDER_FPS, times=None, description=None):
+        self.description = description or f"{len(paths)} images"
+        self.paths = list(paths)
+        self.times = list(times) if times is not None else [i / fps for i in range(len(self.paths))]
+        self.loop = loop
+        self.fps = fps
+        self.pacer = Pacer(pace)
+        self.live = pace == 'realtime'
+        self._index = 0
+        self._offset = 0.0
+
+    @classmethod
+    def from_folder(cls, folder, pace='realtime', loop=False, fps=IMAGE_FOLDER_FPS):
+        paths = sorted(path for path in glob.glob(os.path.join(folder, '*'))
+                       if path.lower().endswith(IMAGE_EXTENSIONS))
+        return cls(paths, pace, loop, fps, description=f"image folder {folder}")
+
+    def read(self):
+        while True:
+            if self._index >= len(self.paths):
+                if not self.loop or not self.paths:
+                    return None
+                self._offset += self.times[-1] - self.times[0] + 1 / self.fps
+                self._index = 0
+            path, media_time = self.paths[self._index], self._offset + self.times[self._index]
+            self._index += 1
+            image = cv2.imread(path)
+            if image is None:
+                log.warning("[SOURCE] Skipping unreadable image %s", path)
+                continue
+            return self.pacer.stamp(media_time), image
+
+
+def path_timestamp(path):
+    """Capture time encoded in a file name like car_20250324_104717.jpg, or None"""
+    match = TIMESTAMP_PATTERN.search(os.path.basename(path))
+    if not match:
+        return None
+    date, clock, fraction = match.groups()
+    try:
+        stamp = datetime.strptime(date + clock, '%Y%m%d%H%M%S').timestamp()
+    except ValueError:
+        return None
+    return stamp + (int(fraction) / 10 ** len(fraction) if fraction else 0.0)
+
+
+def replay_source(path, pace='realtime', loop=False):
+    """A timestamped replay: a CSV manifest of timestamp,path rows, or a folder of
+    images named by capture time. Returns None if path has no timestamps."""
+    if os.path.isfile(path):
+        base = os.path.dirname(path)
+        frames = []
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                frames.append((float(row['timestamp']), os.path.join(base, row['path'])))
+    else:
+        paths = sorted(glob.glob(os.path.join(path, '*')))
+        frames = [(path_timestamp(p), p) for p in paths if p.lower().endswith(IMAGE_EXTENSIONS)]
+        if not frames or any(stamp is None for stamp, _ in frames):
+            return None
+    frames.sort()
+    if not frames:
+        return None
+    start = frames[0][0]
+    return ImageFolderSource([p for _, p in frames], pace, loop, times=[stamp - start for stamp, _ in frames],
+                             description=f"timestamped replay {path}")
+
+
+def open_source(spec, pace='realtime', loop=False, fps=IMAGE_FOLDER_FPS):
+    """Frame source for a lane from a command-line spec.
+
+    '0' or any integer is a webcam, a URL (rtsp://, http://) a network
+    stream, a .csv file a timestamped replay manifest, a folder a
+    timestamped replay when every image name carries its capture time and
+    an image folder otherwise, and any other file a video.
+    """
+    spec = str(spec)
+    if spec.isdigit():
+        return CameraSource(int(spec))
+    if '://' in spec:
+        return CameraSource(spec)
+    if not os.path.exists(spec):
+        raise FileNotFoundError(f"Frame source not found: {spec}")
+    if os.path.isdir(spec) or spec.lower().endswith('.csv'):
+        source = replay_source(spec, pace, loop)
+        if source is not None:
+            return source
+        if os.path.isfile(spec):
+            raise ValueError(f"Replay manifest has no frames: {spec}")
+        return ImageFolderSource.from_folder(spec, pace, loop, fps)
+    return VideoFileSource(spec, pace, loop)
@@ -0,0 +1,159 @@
+import itertools
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from metrics import STAGE_SECONDS
+
+TRACE_CAPACITY = 16384  # spans kept per lane; ~6 per triggered frame is a few minutes at 10 fps
+TRACE_DUMP_SECONDS = 60.0
+TRACE_DIR = 'traces'
+TRACE_STAGES = ('capture', 'detect', 'ocr', 'vote', 'db', 'serial')
+TRACE_TEXT_LENGTH = 16
+
+SPAN_DTYPE = np.dtype([
+    ('frame_id', 'i8'),
+    ('stage', 'u1'),
+    ('start', 'f8'),  # epoch seconds
+    ('duration', 'f4'),  # seconds
+    ('count', 'i4'),  # boxes for detect, track id for ocr
+    ('text', f'U{TRACE_TEXT_LENGTH}'),  # OCR text, vote state, serial command
+])
+
+log = logging.getLogger(__name__)
+
+
+class TraceRing:
+    """Fixed-size ring of stage spans for one lane, allocated up front.
+
+    Any lane thread may add a span: the slot comes from an itertools counter
+    (atomic under the GIL) and the write is a single structured-array
+    assignment, so recording costs about a microsecond and never allocates.
+    current_frame is the frame the lane's main loop is acting on, for spans
+    recorded by the policy rather than the pipeline.
+    """
+
+    def __init__(self, name, capacity=TRACE_CAPACITY):
+        self.name = name
+        self.capacity = capacity
+        self.current_frame = 0
+        self._spans = np.zeros(capacity, dtype=SPAN_DTYPE)
+        self._next = itertools.count()
+
+    def add(self, frame_id, stage, start, duration, count=0, text=''):
+        self._spans[next(self._next) % self.capacity] = (frame_id, TRACE_STAGES.index(stage), start, duration,
+                                                         count, text[:TRACE_TEXT_LENGTH])
+
+    def recent(self, seconds, now=None):
+        """Copy of the spans that started in the last `seconds`, oldest first (unused slots start at 0)"""
+        now = now or time.time()
+        spans = self._spans.copy()
+        spans = spans[spans['start'] >= now - seconds]
+        return spans[np.argsort(spans['start'], kind='stable')]
+
+
+_rings = {}
+_rings_lock = threading.Lock()
+
+
+def trace_ring(name):
+    """The lane's ring, created on first use"""
+    with _rings_lock:
+        ring = _rings.get(name)
+        if ring is None:
+            ring = _rings[name] = TraceRing(name)
+        return ring
+
+
+class _Span:
+    __slots__ = ('count', 'text')
+
+    def __init__(self):
+        self.count = 0
+        self.text = ''
+
+
+@contextmanager
+def stage_span(lane, stage, frame_id=None):
+    """Time a block into the lane's stage histogram and its trace ring.
+
+    Without frame_id the span belongs to the ring's current_frame; the block
+    may set .count and .text on the yielded span.
+    """
+    span = _Span()
+    start = time.time()
+    started = time.perf_counter()
+    try:
+        yield span
+    finally:
+        duration = time.perf_counter() - started
+        STAGE_SECONDS.observe(duration, lane=lane, stage=stage)
+        ring = trace_ring(lane)
+        ring.add(ring.current_frame if frame_id is None else frame_id, stage, start, duration, span.count, span.text)
+
+
+def chrome_trace(rings, seconds=TRACE_DUMP_SECONDS):
+    """Chrome trace-event JSON (chrome://tracing, Perfetto) for the last `seconds` of each ring:
+    one process per lane and one thread row per stage"""
+    events = []
+    now = time.time()
+    for pid, ring in enumerate(rings, start=1):
+        events.append({'ph': 'M', 'name': 'process_name', 'pid': pid, 'tid': 0, 'args': {'name': ring.name}})
+        for tid, stage in enumerate(TRACE_STAGES, start=1):
+            events.append({'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tid, 'args': {'name': stage}})
+            events.append({'ph': 'M', 'name': 'thread_sort_index', 'pid': pid, 'tid': tid, 'args': {'sort_index': tid}})
+        for span in ring.recent(seconds, now):
+            stage = TRACE_STAGES[span['stage']]
+            args = {'frame': int(span['frame_id'])}
+            if stage == 'detect':
+                args['boxes'] = int(span['count'])
+            elif stage == 'ocr':
+                args['track'] = int(span['count'])
+            if span['text']:
+                args['text'] = str(span['text'])
+            events.append({
+                'name': f"{stage} #{int(span['frame_id'])}", 'cat': stage, 'ph': 'X',
+                'ts': round(float(span['start']) * 1e6, 1), 'dur': round(float(span['duration']) * 1e6, 1),
+                'pid': pid, 'tid': TRACE_STAGES.index(stage) + 1, 'args': args,
+            })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def dump_traces(names=None, seconds=TRACE_DUMP_SECONDS, directory=TRACE_DIR):
+    """Write the last `seconds` of the named lanes' rings (all of them by default); returns the path"""
+    with _rings_lock:
+        rings = [ring for name, ring in _rings.items() if names is None or name in names]
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"trace-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(chrome_trace(rings, seconds), f)
+    log.info("[TRACE] Wrote the last %.0fs of %s to %s", seconds, ', '.join(ring.name for ring in rings), path)
+    return path
+
+
+class DumpRequest:
+    """Set from a SIGUSR1 handler and polled by the lane loop, which does the actual dump"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def install(self):
+        if hasattr(signal, 'SIGUSR1'):  # not on Windows; the 't' hotkey still works there
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self._event.set())
+        return self
+
+    def set(self):
+        self._event.set()
+
+    def take(self):
+        """True once per request"""
+        if self._event.is_set():
+            self._event.clear()
+            return True
+        return False
@@ -0,0 +1,133 @@
+import base64
+import json
+
+from archive import UNDATED, archive_months, archive_path, attached, main_db_file
+
+# Browsable history: newest first, keyset-paginated on (time column, id) so every
+# page is an index range scan no matter how far back the operator has scrolled.
+HISTORY_SOURCES = {
+    'transactions': {
+        'table': 'transactions',
+        'columns': ('id', 'plate_number', 'entry_time', 'exit_time', 'duration_hr', 'amount', 'payment_status'),
+        'time': 'exit_time',
+        'filters': {'plate': 'plate_number'},
+    },
+    'events': {
+        'table': 'plates_log',
+        'columns': ('id', 'plate_number', 'payment_status', 'entry_timestamp', 'exit_timestamp', 'action_type'),
+        'time': 'entry_timestamp',
+        'filters': {'plate': 'plate_number', 'action': 'action_type'},
+    },
+}
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(row, source):
+    """Opaque token for the page after row"""
+    key = [row[HISTORY_SOURCES[source]['time']], row['id']]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(token):
+    try:
+        time_value, row_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return time_value, int(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {token}") from e
+
+
+def page_query(source, filters=None, start=None, end=None, cursor=None, limit=DEFAULT_PAGE_SIZE, schema='main'):
+    """Build (sql, params) for one page of source; start/end bound the time column as [start, end)"""
+    spec = HISTORY_SOURCES[source]
+    time_column = spec['time']
+    where, params = [], []
+    for name, value in (filters or {}).items():
+        if value:
+            where.append(f"{spec['filters'][name]} = ?")
+            params.append(value)
+    if start:
+        where.append(f"{time_column} >= ?")
+        params.append(start)
+    if end:
+        where.append(f"{time_column} < ?")
+        params.append(end)
+    if cursor:
+        time_value, row_id = decode_cursor(cursor)
+        if time_value is not None:
+            # Rows without a time sort after every dated row (DESC) but fall outside the row-value
+            # range, so a second index range scan picks them up behind the dated ones
+            dated = _select(spec, schema, where + [f"({time_column}, id) < (?, ?)"])
+            undated = _select(spec, schema, where + [f"{time_column} IS NULL"])
+            sql = (f"SELECT * FROM ({dated}) UNION ALL SELECT * FROM ({undated}) "
+                   f"ORDER BY {time_column} DESC, id DESC LIMIT ?")
+            return sql, params + [time_value, row_id, limit] + params + [limit, limit]
+        where.append(f"{time_column} IS NULL AND id < ?")
+        params.append(row_id)
+    return _select(spec, schema, where), params + [limit]
+
+
+def _select(spec, schema, where):
+    sql = f"SELECT {', '.join(spec['columns'])} FROM {schema}.{spec['table']}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + f" ORDER BY {spec['time']} DESC, id DESC LIMIT ?"
+
+
+def _month_may_match(month, start, end, cursor):
+    """Whether an archive month can hold rows for this page, judged on 'YYYY-MM' prefixes.
+
+    Past a cursor the undated archive is always searched; its rows have no month to rule it out.
+    """
+    if start and month < start[:7]:
+        return False
+    if end and month > end[:7]:
+        return False
+    if cursor and month != UNDATED:
+        time_value = decode_cursor(cursor)[0]
+        if time_value is not None and month > str(time_value)[:7]:
+            return False
+    return True
+
+
+def fetch_page(conn, source, filters=None, start=None, end=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Up to limit + 1 newest rows across the hot database and its monthly archives.
+
+    Archives are attached read-only one at a time, newest month first, and
+    the walk stops at the first month older than every row the page needs,
+    so a recent page never opens an archive. The connection must be opened
+    with uri=True for the read-only attach.
+    """
+    spec = HISTORY_SOURCES[source]
+    columns, time_column = spec['columns'], spec['time']
+
+    def run(schema):
+        sql, params = page_query(source, filters, start, end, cursor, limit + 1, schema)
+        return [dict(zip(columns, row)) for row in conn.execute(sql, params)]
+
+    def sort_key(row):
+        return str(row[time_column] or ''), row['id']
+
+    rows = run('main')
+    db_file = main_db_file(conn)
+    for month in archive_months(db_file):
+        if len(rows) > limit and str(rows[limit][time_column] or '')[:7] > month:
+            break
+        if not _month_may_match(month, start, end, cursor):
+            continue
+        with attached(conn, archive_path(db_file, month)) as schema:
+            rows.extend(run(schema))
+        rows = sorted(rows, key=sort_key, reverse=True)[:limit + 1]
+    return rows
+
+
+def iter_page(conn, source, filters=None, start=None, end=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Yield up to limit rows as dicts, then (None, next_cursor) as the final item"""
+    rows = fetch_page(conn, source, filters, start, end, cursor, limit)
+    for row in rows[:limit]:
+        yield row, None
+    yield None, encode_cursor(rows[limit - 1], source) if len(rows) > limit else None
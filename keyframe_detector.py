@@ -0,0 +1,109 @@
+import cv2
+import numpy as np
+
+LK_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+
+def draw_boxes(frame, boxes):
+    annotated = frame.copy()
+    for x1, y1, x2, y2 in boxes:
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 255, 255), 2)
+    return annotated
+
+
+class KeyframeDetector:
+    """Runs YOLO only on keyframes and carries its boxes forward with sparse
+    Lucas-Kanade optical flow on the plate region in between.
+
+    A keyframe is forced whenever a box loses too many flow points. The
+    keyframe interval adapts to motion: it grows by one while plates barely
+    move and halves when they move fast.
+    """
+
+    def __init__(self, max_interval=8, min_interval=1, motion_low=1.0, motion_high=6.0, min_points=5):
+        self.max_interval = max_interval
+        self.min_interval = min_interval
+        self.motion_low = motion_low  # pixels per frame
+        self.motion_high = motion_high
+        self.min_points = min_points
+        self.interval = min(max_interval, max(min_interval, 2))
+        self.keyframes = 0
+        self.propagated = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the current boxes, e.g. when the lane goes idle"""
+        self._prev_gray = None
+        self._boxes = []
+        self._since_key = 0
+
+    def update(self, frame, detect):
+        """Return (boxes, detected) for frame; detected is False when boxes were propagated"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self._prev_gray is not None and self._prev_gray.shape != gray.shape:
+            self.reset()  # optical flow needs equal sizes; image folders can mix them
+        boxes = None
+        if self._prev_gray is not None and self._boxes and self._since_key < self.interval:
+            boxes = self._propagate(gray)
+
+        detected = boxes is None
+        if detected:
+            boxes = detect(frame)
+            if boxes is None:
+                return None, False
+            if self._boxes and boxes:
+                self._adapt(self._keyframe_motion(boxes) / max(self._since_key, 1))
+            self._since_key = 0
+            self.keyframes += 1
+        else:
+            self.propagated += 1
+
+        self._since_key += 1
+        self._prev_gray = gray
+        self._boxes = boxes
+        return boxes, detected
+
+    def report(self):
+        total = self.keyframes + self.propagated
+        share = self.keyframes / total if total else 0
+        return (f"[KEYFRAMES] {self.keyframes} detected / {self.propagated} propagated "
+                f"({share:.0%} keyframes) | interval {self.interval}")
+
+    def _propagate(self, gray):
+        """Shift every box by the median flow of its corner points, or None if tracking is lost"""
+        height, width = gray.shape
+        moved, motions = [], []
+        for x1, y1, x2, y2 in self._boxes:
+            roi = self._prev_gray[y1:y2, x1:x2]
+            if roi.size == 0:
+                return None
+            points = cv2.goodFeaturesToTrack(roi, maxCorners=20, qualityLevel=0.01, minDistance=3)
+            if points is None or len(points) < self.min_points:
+                return None
+            points = (points + np.array([x1, y1], dtype=np.float32)).astype(np.float32)
+            new_points, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, points, None, **LK_PARAMS)
+            good = status.reshape(-1) == 1
+            if good.sum() < self.min_points:
+                return None
+            shift = np.median((new_points - points).reshape(-1, 2)[good], axis=0)
+            dx, dy = int(round(shift[0])), int(round(shift[1]))
+            motions.append(float(np.hypot(shift[0], shift[1])))
+            moved.append((max(0, x1 + dx), max(0, y1 + dy), min(width, x2 + dx), min(height, y2 + dy)))
+
+        self._adapt(max(motions))
+        return moved
+
+    def _keyframe_motion(self, boxes):
+        """How far the detected boxes are from where the previous boxes were carried to"""
+        def center(box):
+            return (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+        previous = [center(box) for box in self._boxes]
+        return max(min(np.hypot(cx - px, cy - py) for px, py in previous)
+                   for cx, cy in map(center, boxes))
+
+    def _adapt(self, motion):
+        if motion > self.motion_high:
+            self.interval = max(self.min_interval, self.interval // 2)
+        elif motion < self.motion_low:
+            self.interval = min(self.max_interval, self.interval + 1)
@@ -0,0 +1,391 @@
+import argparse
+import logging
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from actuator_scheduler import ActuatorScheduler
+from detection import DETECT_SIZE, RoiMask, ScaledDetector
+from frame_source import IMAGE_FOLDER_FPS, PACING_MODES, open_source
+from frame_trace import TRACE_DUMP_SECONDS, DumpRequest, dump_traces, stage_span
+from keyframe_detector import KeyframeDetector
+from lane_log import LOG_LEVELS, setup_logging
+from lane_pipeline import LanePipeline
+import metrics
+from ocr_cache import OcrCache
+from ocr_service import OcrService, OCR_WORKERS
+from plate_tracker import TrackVotes
+from presence import make_presence, PRESENCE_MODES
+from serial_manager import connect_arduino
+
+PIPELINE_REPORT_INTERVAL = 10  # seconds between queue depth reports
+KEYFRAME_MAX_INTERVAL = 6  # most frames between YOLO runs; 1 runs YOLO on every frame
+PRESENCE_MODE = 'auto'  # 'serial' ultrasonic, 'motion' frame differencing, or 'auto'
+METRICS_PORT = 9100  # car_entry.py and car_exit.py default to the next two
+
+log = logging.getLogger(__name__)
+OCR_CALLS = metrics.REGISTRY.counter('parking_ocr_calls_total', "Crops sent to tesseract, cache misses only")
+OCR_CACHE_LOOKUPS = metrics.REGISTRY.counter(
+    'parking_ocr_cache_lookups_total', "OCR cache lookups by outcome", ('result',))
+# Every OcrService the process's lanes use, a shared one listed once; the OCR metrics are their totals
+_ocr_services = []
+OCR_CALLS.set_function(lambda: sum(service.calls for service in _ocr_services))
+
+
+def _cache_total(attribute):
+    return sum(getattr(service.cache, attribute) for service in _ocr_services if service.cache is not None)
+
+
+OCR_CACHE_LOOKUPS.set_function(lambda: _cache_total('hits'), result='hit')
+OCR_CACHE_LOOKUPS.set_function(lambda: _cache_total('misses'), result='miss')
+
+
+class _DetectRequest:
+    __slots__ = ('frame', 'result', 'done')
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.result = None
+        self.done = threading.Event()
+
+
+class BatchedDetector:
+    """One YOLO model shared by every lane in the process.
+
+    Each lane's detect thread calls detect(frame) and blocks; frames from all
+    lanes that arrive within max_wait of the first one go through a single
+    model() call. A batch is sent as soon as it is full, so with every lane
+    waiting nobody pays the max_wait at all.
+    """
+
+    def __init__(self, model, max_batch=4, max_wait=0.02, imgsz=DETECT_SIZE):
+        self.model = model
+        self.imgsz = imgsz
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.running = False
+        self.batches = 0
+        self.frames = 0
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name="batched-detector", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+        # Release anyone still waiting; LanePipeline skips None results
+        while self._pending:
+            self._pending.popleft().done.set()
+
+    def detect(self, frame):
+        """Return the ultralytics Results for frame, or None if the detector stopped"""
+        request = _DetectRequest(frame)
+        with self._cond:
+            if not self.running:
+                return None
+            self._pending.append(request)
+            self._cond.notify_all()
+        request.done.wait()
+        return request.result
+
+    def report(self):
+        avg = self.frames / self.batches if self.batches else 0
+        return f"[DETECTOR] {self.batches} batches, {self.frames} frames, avg batch {avg:.2f}"
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self.running and not self._pending:
+                    self._cond.wait()
+                if not self.running:
+                    return
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self.running:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+
+            try:
+                results = self.model([request.frame for request in batch], imgsz=self.imgsz, verbose=False)
+            except Exception as e:
+                log.error("[ERROR] Batched detection failed: %s", e)
+                results = [None] * len(batch)
+            for request, result in zip(batch, results):
+                request.result = result
+                request.done.set()
+            self.batches += 1
+            self.frames += len(batch)
+
+
+class GatePolicy:
+    """What the entry and exit policies share: the gate Arduino, the scheduler
+    timing its commands, per-track plate votes, and the lane's serial, vote
+    and decision metrics. Subclasses implement handle_plate()."""
+
+    window_title = 'Gate'
+    VOTE_THRESHOLD = 0.9
+
+    def __init__(self, arduino=None, name='lane'):
+        self.arduino = arduino  # a serial_manager.SerialDevice, or None without a gate
+        self.name = name  # metrics label and trace ring
+        # Gate and buzzer commands are timed by the scheduler thread so the lane never sleeps
+        self.actuators = ActuatorScheduler(self.send_command)
+        self.votes = TrackVotes(threshold=self.VOTE_THRESHOLD)  # one plate consensus per tracked car
+
+    def start(self):
+        self.actuators.start()
+
+    def stop(self):
+        self.actuators.stop()  # sends a pending gate close before the port goes
+        if self.arduino:
+            self.arduino.stop()
+
+    def show_status(self):
+        pass
+
+    def send_command(self, command):
+        """Queue command for the gate Arduino; the device's writer thread sends it"""
+        with stage_span(self.name, 'serial') as span:
+            span.text = command
+            sent = self.arduino.send(command) if self.arduino else False
+        metrics.SERIAL_COMMANDS.inc(lane=self.name, result='sent' if sent else 'failed')
+        return sent
+
+    def vote(self, track_id, plate, now, confidences=None, cached=False):
+        """Add a read to its track's vote; the decided plate, or None while it is still open"""
+        with stage_span(self.name, 'vote') as span:
+            decided = self.votes.add(track_id, plate, now, confidences, cached)
+            span.text = decided or f"pending {plate}"
+        return decided
+
+    def record_decision(self, granted, first_seen=None):
+        metrics.GATE_DECISIONS.inc(lane=self.name, decision='granted' if granted else 'denied')
+        if granted and first_seen:
+            metrics.SIGHTING_TO_GATE_SECONDS.observe(time.time() - first_seen, lane=self.name)
+
+
+class Lane:
+    """One frame source and its entry/exit policy, fed by its own LanePipeline.
+
+    Detection is only armed while the lane's presence trigger sees a vehicle.
+    `infer` runs the model on a letterboxed image of detect_size; plates are
+    still cropped from the native-resolution frame. Headless lanes never
+    draw their annotated frames.
+    """
+
+    def __init__(self, name, source, policy, infer, ocr=None, keyframe_max_interval=KEYFRAME_MAX_INTERVAL,
+                 presence_mode=PRESENCE_MODE, detect_size=DETECT_SIZE, roi=None, headless=False):
+        self.name = name
+        self.source = source
+        self.policy = policy  # EntryPolicy / ExitPolicy
+        self.presence = make_presence(presence_mode, policy.arduino)
+        keyframes = KeyframeDetector(max_interval=keyframe_max_interval) if keyframe_max_interval > 1 else None
+        detect = ScaledDetector(infer, size=detect_size, roi=roi)
+        self.pipeline = LanePipeline(source, detect=detect, trigger=self.presence, ocr=ocr,
+                                     keyframes=keyframes, render=not headless, name=name)
+        if not any(service is self.pipeline.ocr for service in _ocr_services):
+            _ocr_services.append(self.pipeline.ocr)
+
+    @property
+    def window_title(self):
+        return f"{self.policy.window_title} [{self.name}]"
+
+    def start(self):
+        self.policy.start()
+        self.presence.start()
+        self.pipeline.start()
+
+    def stop(self):
+        self.pipeline.stop()
+        self.presence.stop()
+        self.policy.stop()
+        self.source.release()
+
+
+def print_status(lanes):
+    for lane in lanes:
+        lane.policy.show_status()
+        print(f"{lane.name}: {lane.pipeline.report()}")
+
+
+def run_lanes(lanes, detector=None, ocr=None, headless=False, trace_seconds=TRACE_DUMP_SECONDS):
+    """Drive every lane's plate reads through its policy until 'q' (Ctrl+C when
+    headless) or every source has ended and been drained.
+
+    't' or SIGUSR1 dumps the last trace_seconds of every lane's frame trace.
+    """
+    dump_request = DumpRequest().install()
+    for lane in lanes:
+        lane.start()
+    last_report = time.time()
+
+    try:
+        while any(lane.pipeline.active for lane in lanes):
+            for lane in lanes:
+                annotated_frame = lane.pipeline.display.get_nowait()
+                if annotated_frame is not None:
+                    cv2.imshow(lane.window_title, annotated_frame)
+
+                for read in lane.pipeline.drain_reads():
+                    lane.pipeline.trace.current_frame = read.frame_id
+                    if read.plate:
+                        lane.policy.handle_plate(read.plate, read.track_id, read.confidences, read.first_seen,
+                                                 read.cached)
+                    if not headless:
+                        cv2.imshow(f"Plate ({lane.name})", read.plate_img)
+                        cv2.imshow(f"Processed ({lane.name})", read.thresh)
+
+            if headless:
+                time.sleep(0.01)
+            else:
+                key = cv2.waitKey(10) & 0xFF
+                if key == ord('s'):
+                    print_status(lanes)
+                elif key == ord('t'):
+                    dump_request.set()
+                elif key == ord('q'):
+                    break
+
+            if dump_request.take():
+                dump_traces([lane.name for lane in lanes], trace_seconds)
+
+            if time.time() - last_report >= PIPELINE_REPORT_INTERVAL:
+                for lane in lanes:
+                    log.info("%s: %s", lane.name, lane.pipeline.report())
+                    log.info("%s: %s", lane.name, lane.policy.votes.report())
+                if detector:
+                    log.info(detector.report())
+                for service in {id(lane.pipeline.ocr): lane.pipeline.ocr for lane in lanes}.values():
+                    log.info(service.report())
+                last_report = time.time()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if detector:
+            detector.stop()
+        for lane in lanes:
+            lane.stop()
+        if ocr:
+            ocr.close()
+        if not headless:
+            cv2.destroyAllWindows()
+        else:
+            print_status(lanes)
+
+
+def parse_lane(spec):
+    """'entry:0', 'exit:1:/dev/ttyACM1' or 'entry:recordings/gate.mp4' -> (policy, source spec, arduino port).
+
+    The port is the part after the last ':' when it names a serial device,
+    so sources such as rtsp:// URLs can contain colons themselves.
+    """
+    policy, _, rest = spec.partition(':')
+    if policy not in ('entry', 'exit') or not rest:
+        raise argparse.ArgumentTypeError(f"lane must look like entry:SOURCE[:PORT], got '{spec}'")
+    source, _, port = rest.rpartition(':')
+    if source and (port.startswith('/dev/') or port.upper().startswith('COM')):
+        return policy, source, port
+    return policy, rest, None
+
+
+def add_lane_arguments(parser, metrics_port=METRICS_PORT):
+    """Frame source, logging and metrics options shared by every lane script"""
+    parser.add_argument('--headless', action='store_true',
+                        help="no windows: skip all rendering, stop with Ctrl+C or when replays end")
+    parser.add_argument('--pace', choices=PACING_MODES, default='realtime',
+                        help="replays: recorded speed, or as fast as the lane can go without dropping frames")
+    parser.add_argument('--loop', action='store_true', help="restart replays when they end, for soak tests")
+    parser.add_argument('--fps', type=float, default=IMAGE_FOLDER_FPS,
+                        help="frame rate for image folders without timestamps")
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default='INFO',
+                        help="DEBUG also logs every serial command; repeated lines are rate-limited")
+    parser.add_argument('--metrics-port', type=int, default=metrics_port,
+                        help="serve Prometheus metrics on this port (0 = off)")
+    parser.add_argument('--trace-seconds', type=float, default=TRACE_DUMP_SECONDS,
+                        help="how much frame trace 't' or SIGUSR1 writes to traces/ for chrome://tracing")
+
+
+def start_monitoring(args):
+    setup_logging(args.log_level)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+
+
+def open_lane_source(spec, args):
+    source = open_source(spec, pace=args.pace, loop=args.loop, fps=args.fps)
+    print(f"[SOURCE] {source} ({'live' if source.live else 'lossless'}, {args.pace} pacing)")
+    return source
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve several gate lanes from one process and one YOLO model")
+    parser.add_argument('--lane', action='append', type=parse_lane, required=True,
+                        help="entry:SOURCE[:PORT] or exit:SOURCE[:PORT], SOURCE being a camera index, "
+                             "stream URL, video file, image folder or replay manifest; repeat per lane")
+    parser.add_argument('--model', default='best3.pt')
+    parser.add_argument('--max-wait', type=float, default=0.02,
+                        help="seconds the detector waits to fill a batch")
+    parser.add_argument('--detect-size', type=int, default=DETECT_SIZE,
+                        help="side in pixels of the letterboxed frame the detector sees")
+    parser.add_argument('--roi-file',
+                        help="JSON of {lane name: [[[x, y], ...], ...]} normalised polygons where plates can appear")
+    parser.add_argument('--keyframe-interval', type=int, default=KEYFRAME_MAX_INTERVAL,
+                        help="max frames between YOLO runs, boxes follow optical flow in between (1 = off)")
+    parser.add_argument('--presence', choices=PRESENCE_MODES, default=PRESENCE_MODE,
+                        help="what arms detection: the Arduino ultrasonic sensor, camera motion, or auto")
+    parser.add_argument('--ocr-workers', type=int, default=OCR_WORKERS,
+                        help="long-lived tesseract workers shared by all lanes")
+    parser.add_argument('--ocr-cache-ttl', type=float, default=10.0,
+                        help="seconds a cached plate read is reused for near-identical crops")
+    add_lane_arguments(parser)
+    args = parser.parse_args()
+    start_monitoring(args)
+
+    # Imported here: the lane scripts import this module for their own main()
+    from ultralytics import YOLO
+    import car_entry
+    import car_exit
+
+    model = YOLO(args.model)  # loaded once for every lane
+    detector = BatchedDetector(model, max_batch=len(args.lane), max_wait=args.max_wait, imgsz=args.detect_size)
+    detector.start()
+    ocr = OcrService(workers=args.ocr_workers, cache=OcrCache(ttl=args.ocr_cache_ttl))
+
+    lanes = []
+    counts = {}
+    for policy, source, port in args.lane:
+        module = car_entry if policy == 'entry' else car_exit
+        counts[policy] = counts.get(policy, 0) + 1
+        name = f"{policy}-{counts[policy]}"
+        if port is None and len(args.lane) > 1:
+            print(f"[WARNING] No Arduino port given for {policy} lane on {source}; gate commands disabled")
+            arduino = None
+        else:
+            arduino = connect_arduino(port, name)
+        policy_obj = module.EntryPolicy(arduino, name) if policy == 'entry' else module.ExitPolicy(arduino, name)
+        roi = RoiMask.load(args.roi_file, name) if args.roi_file else None
+        lanes.append(Lane(name, open_lane_source(source, args), policy_obj,
+                          infer=detector.detect, ocr=ocr, keyframe_max_interval=args.keyframe_interval,
+                          presence_mode=args.presence, detect_size=args.detect_size, roi=roi,
+                          headless=args.headless))
+
+    print(f"[SYSTEM] Serving {len(lanes)} lanes: {', '.join(lane.name for lane in lanes)}")
+    run_lanes(lanes, detector=detector, ocr=ocr, headless=args.headless, trace_seconds=args.trace_seconds)
+    print("[SYSTEM] Shutting down...")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import logging
+import threading
+import time
+
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(message)s'
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+RATE_LIMIT_INTERVAL = 5.0  # seconds per rate-limit window
+RATE_LIMIT_BURST = 5  # records of one message template let through per window
+# Gate decisions and what the database recorded: an audit trail, so never rate-limited
+AUDIT_TAGS = ('[LOGGED]', '[VALIDATION]', '[ACCESS GRANTED]', '[ACCESS DENIED]', '[PAYMENT]',
+              '[GATE]', '[BUZZER]', '[ALERT]')
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets at most `burst` records of each message template through per `interval`.
+
+    Templates are the unformatted msg, so "[DETECTED] Plate: %s" for every
+    frame of every car counts as one message. The first record of a new
+    window reports how many were suppressed in the last one. Errors and
+    decision records tagged with one of AUDIT_TAGS always get through.
+    """
+
+    def __init__(self, interval=RATE_LIMIT_INTERVAL, burst=RATE_LIMIT_BURST):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._windows = {}  # {(logger, msg): [window start, emitted, suppressed]}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR or str(record.msg).startswith(AUDIT_TAGS):
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} ({suppressed} similar suppressed)"
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+def setup_logging(level='INFO', interval=RATE_LIMIT_INTERVAL, burst=RATE_LIMIT_BURST):
+    """Log to stderr at level, rate-limiting per-frame chatter below ERROR"""
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.addFilter(RateLimitFilter(interval, burst))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
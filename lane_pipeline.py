@@ -0,0 +1,253 @@
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+
+from frame_trace import stage_span, trace_ring
+from metrics import FRAMES, PLATE_READS, QUEUE_DEPTH, QUEUE_DROPPED, STAGE_SECONDS
+from ocr_cache import OcrCache
+from ocr_service import OcrService
+from plate_consensus import correct_plate
+from plate_tracker import PlateTracker
+from keyframe_detector import draw_boxes
+
+Frame = namedtuple('Frame', ['frame_id', 'captured_at', 'image'])
+PlateCrop = namedtuple('PlateCrop', ['frame_id', 'captured_at', 'track_id', 'first_seen', 'box', 'image'])
+PlateRead = namedtuple('PlateRead', ['frame_id', 'captured_at', 'track_id', 'first_seen', 'box', 'plate_img',
+                                     'thresh', 'text', 'plate', 'confidences', 'cached'])
+
+log = logging.getLogger(__name__)
+
+
+class DropOldestQueue:
+    """Bounded queue that discards its oldest item instead of blocking the producer"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def put_wait(self, item):
+        """Wait for room instead of dropping, for replays where every frame counts; False once closed"""
+        with self._cond:
+            while len(self._items) >= self.maxsize and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return False
+            self._items.append(item)
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Return the oldest item, or None if nothing arrived within timeout"""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            return self._pop()
+
+    def get_nowait(self):
+        with self._cond:
+            return self._pop()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def finished(self):
+        """Closed and fully drained"""
+        with self._cond:
+            return self._closed and not self._items
+
+    def _pop(self):
+        if not self._items:
+            return None
+        item = self._items.popleft()
+        self._cond.notify_all()  # room for a waiting put_wait
+        return item
+
+    def __len__(self):
+        return len(self._items)
+
+
+class LanePipeline:
+    """Capture -> detect -> OCR stages running on their own threads.
+
+    The capture thread only ever keeps the newest frame from a live source,
+    so detection always works on what the camera sees now rather than on a
+    backlog; replays at max pacing are lossless instead, every stage waiting
+    for the next. When a replay ends the stages drain and close in turn.
+    Plate reads come out of `reads` for the lane's main loop to vote on and
+    act upon; unless render is off, `display` holds the latest annotated
+    frame for cv2.imshow on the main thread.
+    With a KeyframeDetector, YOLO only runs on keyframes and boxes are
+    carried forward by optical flow in between. Boxes are tracked across
+    frames and only the best few crops of each track are sent to OCR.
+    Waiting crops are OCR'd as one batch on `ocr`, an OcrService that may
+    be shared between lanes.
+    """
+
+    def __init__(self, source, detect, trigger=None, ocr=None, tracker=None, keyframes=None,
+                 crop_queue_size=8, read_queue_size=16, render=True, name='lane'):
+        self.name = name  # metrics label and trace ring
+        self.trace = trace_ring(name)
+        self.source = source  # a FrameSource
+        self.detect = detect  # frame -> [(x1, y1, x2, y2)] in frame coordinates, e.g. a ScaledDetector
+        self.trigger = trigger or (lambda frame: True)  # presence check on each frame before detection
+        self._owns_ocr = ocr is None
+        self.ocr = ocr or OcrService(cache=OcrCache())
+        self.tracker = tracker or PlateTracker()
+        self.keyframes = keyframes
+        self.frames = DropOldestQueue(1)
+        self.crops = DropOldestQueue(crop_queue_size)
+        self.reads = DropOldestQueue(read_queue_size)
+        self.display = DropOldestQueue(1)
+        self.render = render
+        self.lossless = not source.live
+        self.running = False
+        self._threads = []
+        for queue_name, q in (('frames', self.frames), ('crops', self.crops), ('reads', self.reads)):
+            QUEUE_DEPTH.set_function(q.__len__, lane=name, queue=queue_name)
+            QUEUE_DROPPED.set_function(lambda q=q: q.dropped, lane=name, queue=queue_name)
+
+    def start(self):
+        self.running = True
+        for stage, target, output in (('capture', self._capture_loop, self.frames),
+                                      ('detect', self._detect_loop, self.crops),
+                                      ('ocr', self._ocr_loop, self.reads)):
+            thread = threading.Thread(target=self._run_stage, args=(stage, target, output),
+                                      name=f"{self.name}-{stage}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self.running = False
+        for q in (self.frames, self.crops, self.reads, self.display):
+            q.close()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+        if self._owns_ocr:
+            self.ocr.close()
+
+    @property
+    def active(self):
+        """Still producing plate reads: not stopped, and a finished source not yet drained"""
+        return self.running and not self.reads.finished()
+
+    def drain_reads(self):
+        """Yield every plate read that is currently waiting, without blocking"""
+        while True:
+            read = self.reads.get_nowait()
+            if read is None:
+                return
+            yield read
+
+    def queue_depths(self):
+        return {'frames': len(self.frames), 'crops': len(self.crops), 'reads': len(self.reads)}
+
+    def report(self):
+        stages = (('frames', self.frames), ('crops', self.crops), ('reads', self.reads))
+        return "[PIPELINE] " + " | ".join(
+            f"{name} {len(q)}/{q.maxsize} (dropped {q.dropped})" for name, q in stages
+        ) + "\n" + self.tracker.report() + ("\n" + self.keyframes.report() if self.keyframes else "")
+
+    def _put(self, queue, item):
+        if self.lossless:
+            queue.put_wait(item)
+        else:
+            queue.put(item)
+
+    def _run_stage(self, name, loop, output):
+        """Run one stage; however it ends, close its output so the stages after it drain and finish"""
+        try:
+            loop()
+        except Exception:
+            log.exception("[PIPELINE] %s stage of %s failed, finishing lane", name, self.name)
+        finally:
+            output.close()
+
+    # ===== Stages =====
+    def _capture_loop(self):
+        frame_id = 0
+        while self.running:
+            with stage_span(self.name, 'capture', frame_id + 1):
+                captured = self.source.read()
+            if captured is None:
+                log.info("[PIPELINE] %s returned no frame, finishing lane", self.source)
+                break
+            FRAMES.inc(lane=self.name)
+            frame_id += 1
+            self._put(self.frames, Frame(frame_id, *captured))
+
+    def _detect_loop(self):
+        while self.running:
+            frame = self.frames.get(timeout=0.1)
+            if frame is None:
+                if self.frames.closed:
+                    break
+                continue
+            if not self.trigger(frame.image):
+                if self.keyframes:
+                    self.keyframes.reset()
+                if self.render:
+                    self.display.put(frame.image)
+                continue
+
+            with stage_span(self.name, 'detect', frame.frame_id) as span:
+                if self.keyframes:
+                    boxes, _ = self.keyframes.update(frame.image, self.detect)
+                else:
+                    boxes = self.detect(frame.image)
+                span.count = len(boxes or ())
+            if boxes is None:
+                continue
+
+            for track, (x1, y1, x2, y2) in self.tracker.update(boxes, frame.captured_at):
+                plate_img = frame.image[max(y1, 0):y2, max(x1, 0):x2]
+                if plate_img.size == 0 or not self.tracker.select_for_ocr(track, plate_img, frame.captured_at):
+                    continue
+                self._put(self.crops, PlateCrop(frame.frame_id, frame.captured_at, track.track_id,
+                                                track.first_seen, (x1, y1, x2, y2), plate_img))
+            if self.render:
+                self.display.put(draw_boxes(frame.image, boxes))
+
+    def _ocr_loop(self):
+        while self.running:
+            crop = self.crops.get(timeout=0.1)
+            if crop is None:
+                if self.crops.closed:
+                    break
+                continue
+            batch = [crop]
+            while len(batch) < self.ocr.workers:
+                crop = self.crops.get_nowait()
+                if crop is None:
+                    break
+                batch.append(crop)
+
+            start, started = time.time(), time.perf_counter()
+            results = self.ocr.read_plates([c.image for c in batch])
+            duration = time.perf_counter() - started
+            STAGE_SECONDS.observe(duration, lane=self.name, stage='ocr')
+            for crop, (thresh, plate_text, confidences, cached) in zip(batch, results):
+                self.trace.add(crop.frame_id, 'ocr', start, duration, crop.track_id or 0, plate_text)
+                plate, plate_confidences = correct_plate(plate_text, confidences)
+                PLATE_READS.inc(lane=self.name, result='valid' if plate else 'invalid')
+                self._put(self.reads, PlateRead(crop.frame_id, crop.captured_at, crop.track_id, crop.first_seen,
+                                                crop.box, crop.image, thresh, plate_text, plate, plate_confidences,
+                                                cached))
@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+HASH_SIZE = 16  # 17x16 difference hash -> 256 bits
+
+
+def plate_hash(thresh, hash_size=HASH_SIZE):
+    """Difference hash of a thresholded plate crop as an int of hash_size**2 bits"""
+    small = cv2.resize(thresh, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class OcrCache:
+    """Bounded LRU of OCR reads (text and confidences) keyed by the perceptual hash of the crop.
+
+    A lookup matches any stored hash within max_distance bits, so the dozens
+    of near-identical crops of a car waiting at the barrier are OCR'd once.
+    Entries expire ttl seconds after they were read (hits do not refresh
+    them), so a different car stopping in the same spot gets a fresh read.
+    """
+
+    def __init__(self, maxsize=256, max_distance=12, ttl=10.0):
+        self.maxsize = maxsize
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()  # {hash: (read, stored_at)}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached read for a hash within tolerance of key, or None"""
+        with self._lock:
+            self._expire(time.monotonic())
+            match = key if key in self._entries else None
+            if match is None:
+                best = self.max_distance + 1
+                for stored in self._entries:
+                    distance = (stored ^ key).bit_count()
+                    if distance < best:
+                        match, best = stored, distance
+            if match is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(match)
+            self.hits += 1
+            return self._entries[match][0]
+
+    def put(self, key, read):
+        with self._lock:
+            self._entries[key] = (read, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def report(self):
+        s = self.stats()
+        return (f"[OCR CACHE] {s['size']}/{self.maxsize} entries | hits {s['hits']} misses {s['misses']} "
+                f"({s['hit_rate']:.0%}) | evicted {s['evictions']} expired {s['expirations']}")
+
+    def _expire(self, now):
+        expired = [key for key, (_, stored_at) in self._entries.items() if now - stored_at > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        self.expirations += len(expired)
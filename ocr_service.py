@@ -0,0 +1,151 @@
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ocr_cache import plate_hash
+from plate_ocr import PLATE_CHARS, OCR_CONFIG, preprocess_plate
+
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM, RIL, iterate_level
+except ImportError:  # tesserocr is in requirements.txt; pytesseract forks tesseract per crop
+    PyTessBaseAPI = None
+    import pytesseract
+    from pytesseract import Output
+
+OCR_WORKERS = 2
+
+log = logging.getLogger(__name__)
+
+# cached: the read was reused from a near-identical earlier crop rather than
+# made from this one, so it is not new evidence about the plate
+OcrRead = namedtuple('OcrRead', ['text', 'confidences', 'cached'])
+
+
+class TesseractEngine:
+    """A tesseract instance initialised once and reused for every crop.
+
+    Uses the in-process tesserocr API from requirements.txt; only where it
+    could not be installed does each read go through pytesseract and its
+    per-call subprocess.
+    """
+
+    def __init__(self):
+        self.api = None
+        if PyTessBaseAPI:
+            # --psm 8 / --oem 3 as in OCR_CONFIG
+            self.api = PyTessBaseAPI(psm=PSM.SINGLE_WORD, oem=OEM.DEFAULT)
+            self.api.SetVariable('tessedit_char_whitelist', PLATE_CHARS)
+
+    def read(self, thresh):
+        """Return (text, per-character confidences in 0..1), spaces removed"""
+        if self.api is None:
+            return self._read_pytesseract(thresh)
+        image = np.ascontiguousarray(thresh)
+        height, width = image.shape[:2]
+        self.api.SetImageBytes(image.tobytes(), width, height, 1, width)
+        self.api.Recognize()
+        chars, confs = [], []
+        iterator = self.api.GetIterator()
+        if iterator is not None:
+            for symbol in iterate_level(iterator, RIL.SYMBOL):
+                char = (symbol.GetUTF8Text(RIL.SYMBOL) or '').strip()
+                if char:
+                    chars.append(char)
+                    confs.extend([symbol.Confidence(RIL.SYMBOL) / 100] * len(char))
+        return ''.join(chars), confs
+
+    @staticmethod
+    def _read_pytesseract(thresh):
+        """pytesseract only reports word confidences; every char of a word gets its word's"""
+        data = pytesseract.image_to_data(thresh, config=OCR_CONFIG, output_type=Output.DICT)
+        chars, confs = [], []
+        for word, conf in zip(data['text'], data['conf']):
+            word = word.strip().replace(" ", "")
+            if word and float(conf) >= 0:
+                chars.append(word)
+                confs.extend([float(conf) / 100] * len(word))
+        return ''.join(chars), confs
+
+    def close(self):
+        if self.api is not None:
+            self.api.End()
+            self.api = None
+
+
+class OcrService:
+    """Pool of long-lived OCR workers shared by every lane in the process.
+
+    Crops are passed as in-memory numpy arrays; each worker thread owns its
+    own TesseractEngine, and tesserocr releases the GIL while recognising,
+    so the workers run in parallel. With an OcrCache, crops that hash close
+    to a recent one reuse its text instead of reaching tesseract.
+    """
+
+    def __init__(self, workers=OCR_WORKERS, cache=None):
+        self.workers = workers
+        self.cache = cache
+        self.calls = 0
+        self._local = threading.local()
+        self._engines = []
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr',
+                                        initializer=self._init_worker)
+        if PyTessBaseAPI is None:
+            log.warning("[OCR] tesserocr not installed (see requirements.txt); "
+                        "falling back to a tesseract subprocess per crop")
+
+    def _init_worker(self):
+        engine = TesseractEngine()
+        self._local.engine = engine
+        with self._lock:
+            self._engines.append(engine)
+
+    def _read_text(self, thresh):
+        with self._lock:
+            self.calls += 1
+        return OcrRead(*self._local.engine.read(thresh), cached=False)
+
+    def _read_cached(self, thresh):
+        if self.cache is None:
+            return self._read_text(thresh)
+        key = plate_hash(thresh)
+        read = self.cache.get(key)
+        if read is not None:
+            return read._replace(cached=True)
+        read = self._read_text(thresh)
+        self.cache.put(key, read)
+        return read
+
+    def _read_plate(self, plate_img):
+        thresh = preprocess_plate(plate_img)
+        return (thresh, *self._read_cached(thresh))
+
+    def read_plate(self, plate_img):
+        """Preprocess and OCR one BGR plate crop, returning (thresh, plate_text, confidences, cached)"""
+        return self._pool.submit(self._read_plate, plate_img).result()
+
+    def read_plates(self, plate_imgs):
+        """Preprocess and OCR a batch of crops across the workers, in order"""
+        return list(self._pool.map(self._read_plate, plate_imgs))
+
+    def read_thresholded(self, thresh):
+        """OCR an already thresholded crop through the cache, returning an OcrRead"""
+        return self._pool.submit(self._read_cached, thresh).result()
+
+    def read_text(self, thresh):
+        """OCR an already thresholded crop, returning just the text"""
+        return self._pool.submit(self._read_text, thresh).result()[0]
+
+    def report(self):
+        line = f"[OCR] {self.workers} workers | {self.calls} tesseract calls"
+        return f"{line}\n{self.cache.report()}" if self.cache else line
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        with self._lock:
+            for engine in self._engines:
+                engine.close()
+            self._engines = []
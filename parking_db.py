@@ -0,0 +1,289 @@
+import argparse
+import os
+import sqlite3
+
+from rollups import ROLLUP_SCHEMA, backfill_statements
+
+DB_FILE = 'data/parking.db'
+BUSY_TIMEOUT_MS = 5000  # how long a writer waits for another process' lock before failing
+
+# ===== Schema Migrations =====
+# Each migration upgrades the schema by one version; PRAGMA user_version records
+# the version a database file is at. Never edit a released migration, append one.
+MIGRATIONS = [
+    ("base tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS plates_log (
+            plate_number TEXT,
+            payment_status INTEGER,
+            entry_timestamp TEXT,
+            exit_timestamp TEXT,
+            action_type TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS transactions (
+            plate_number TEXT,
+            entry_time TEXT,
+            exit_time TEXT,
+            duration_hr REAL,
+            amount INTEGER,
+            payment_status INTEGER
+        )
+        ''',
+    ]),
+    ("integer primary keys", [
+        # Rebuild both tables around an explicit id that keeps the old rowids. Timestamps move to
+        # the one format every writer uses, 'YYYY-MM-DD HH:MM:SS', so text order is time order
+        # (older rows have a 'T' separator and microseconds); anything unparseable is kept as is.
+        '''
+        CREATE TABLE plates_log_new (
+            id INTEGER PRIMARY KEY,
+            plate_number TEXT NOT NULL,
+            payment_status INTEGER NOT NULL DEFAULT 0,
+            entry_timestamp TEXT,
+            exit_timestamp TEXT,
+            action_type TEXT NOT NULL
+        )
+        ''',
+        '''
+        INSERT INTO plates_log_new (id, plate_number, payment_status, entry_timestamp, exit_timestamp, action_type)
+        SELECT rowid, plate_number, COALESCE(payment_status, 0),
+               COALESCE(datetime(entry_timestamp), entry_timestamp), COALESCE(datetime(exit_timestamp), exit_timestamp),
+               COALESCE(action_type, '')
+        FROM plates_log WHERE plate_number IS NOT NULL
+        ''',
+        "DROP TABLE plates_log",
+        "ALTER TABLE plates_log_new RENAME TO plates_log",
+        '''
+        CREATE TABLE transactions_new (
+            id INTEGER PRIMARY KEY,
+            plate_number TEXT NOT NULL,
+            entry_time TEXT,
+            exit_time TEXT,
+            duration_hr REAL,
+            amount INTEGER,
+            payment_status INTEGER
+        )
+        ''',
+        '''
+        INSERT INTO transactions_new (id, plate_number, entry_time, exit_time, duration_hr, amount, payment_status)
+        SELECT rowid, plate_number, COALESCE(datetime(entry_time), entry_time), COALESCE(datetime(exit_time), exit_time),
+               duration_hr, amount, payment_status
+        FROM transactions WHERE plate_number IS NOT NULL
+        ''',
+        "DROP TABLE transactions",
+        "ALTER TABLE transactions_new RENAME TO transactions",
+    ]),
+    ("indexes for the lane, payment and dashboard lookups", [
+        # Latest ENTRY/EXIT of a plate (car_entry)
+        "CREATE INDEX IF NOT EXISTS idx_plates_log_plate_action_entry "
+        "ON plates_log (plate_number, action_type, entry_timestamp)",
+        # Latest row of a plate regardless of action (is_vehicle_in_parking, lookup_entry_time)
+        "CREATE INDEX IF NOT EXISTS idx_plates_log_plate_entry ON plates_log (plate_number, entry_timestamp)",
+        # Last paid/unpaid stay of a plate (car_exit, process_payment)
+        "CREATE INDEX IF NOT EXISTS idx_plates_log_plate_paid_entry "
+        "ON plates_log (plate_number, payment_status, entry_timestamp)",
+        # Dashboard: unauthorized exits, latest activity and hourly entries
+        "CREATE INDEX IF NOT EXISTS idx_plates_log_action_exit ON plates_log (action_type, exit_timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_plates_log_entry ON plates_log (entry_timestamp)",
+        # Dashboard: recent transactions and today's revenue
+        "CREATE INDEX IF NOT EXISTS idx_transactions_exit ON transactions (exit_time)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_plate_exit ON transactions (plate_number, exit_time)",
+    ]),
+    ("open sessions keyed by plate", [
+        '''
+        CREATE TABLE parking_sessions (
+            plate_number TEXT PRIMARY KEY,
+            entry_log_id INTEGER,
+            entry_timestamp TEXT,
+            payment_status INTEGER NOT NULL DEFAULT 0,
+            paid_at TEXT,
+            paid_until TEXT,
+            exit_timestamp TEXT
+        )
+        ''',
+        # Each plate's latest ENTRY/EXIT row becomes its session. The payment kiosk marked paid
+        # rows EXIT, with the payment time as exit_timestamp, and nothing recorded the gate
+        # exit. Sessions close at the exit gate now, so a payment still inside its grace period
+        # stays open: the car may not have left yet. An older payment stays closed as before; the
+        # old code counted it as the exit, and the car would have to pay again to leave.
+        '''
+        INSERT INTO parking_sessions (plate_number, entry_log_id, entry_timestamp, payment_status,
+                                      paid_at, paid_until, exit_timestamp)
+        SELECT plate_number, id, entry_timestamp, payment_status,
+               CASE WHEN payment_status = 1 THEN datetime(exit_timestamp) END,
+               CASE WHEN payment_status = 1 THEN datetime(exit_timestamp, '+15 minutes') END,
+               CASE WHEN payment_status = 1 AND datetime(exit_timestamp, '+15 minutes') > datetime('now', 'localtime')
+                    THEN NULL ELSE NULLIF(exit_timestamp, '') END
+        FROM plates_log AS latest
+        WHERE id = (SELECT id FROM plates_log
+                    WHERE plate_number = latest.plate_number AND action_type IN ('ENTRY', 'EXIT')
+                    ORDER BY entry_timestamp DESC, id DESC LIMIT 1)
+        ''',
+    ]),
+    ("occupancy counters maintained by triggers", [
+        "CREATE TABLE parking_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+        '''
+        INSERT INTO parking_counters (name, value)
+        SELECT 'occupancy', COUNT(*) FROM parking_sessions WHERE exit_timestamp IS NULL
+        UNION ALL
+        SELECT 'unpaid', COUNT(*) FROM parking_sessions WHERE exit_timestamp IS NULL AND payment_status = 0
+        UNION ALL
+        SELECT 'capacity', 0
+        ''',
+        # Every writer goes through parking_sessions, so the counters move in the same transaction
+        '''
+        CREATE TRIGGER parking_sessions_count_insert AFTER INSERT ON parking_sessions BEGIN
+            UPDATE parking_counters SET value = value + (NEW.exit_timestamp IS NULL) WHERE name = 'occupancy';
+            UPDATE parking_counters SET value = value + (NEW.exit_timestamp IS NULL AND NEW.payment_status = 0)
+            WHERE name = 'unpaid';
+        END
+        ''',
+        '''
+        CREATE TRIGGER parking_sessions_count_update AFTER UPDATE ON parking_sessions BEGIN
+            UPDATE parking_counters SET value = value + (NEW.exit_timestamp IS NULL) - (OLD.exit_timestamp IS NULL)
+            WHERE name = 'occupancy';
+            UPDATE parking_counters SET value = value + (NEW.exit_timestamp IS NULL AND NEW.payment_status = 0)
+                                                      - (OLD.exit_timestamp IS NULL AND OLD.payment_status = 0)
+            WHERE name = 'unpaid';
+        END
+        ''',
+        '''
+        CREATE TRIGGER parking_sessions_count_delete AFTER DELETE ON parking_sessions BEGIN
+            UPDATE parking_counters SET value = value - (OLD.exit_timestamp IS NULL) WHERE name = 'occupancy';
+            UPDATE parking_counters SET value = value - (OLD.exit_timestamp IS NULL AND OLD.payment_status = 0)
+            WHERE name = 'unpaid';
+        END
+        ''',
+    ]),
+    ("change feed of log, payment and session writes", [
+        # AUTOINCREMENT so a sequence number is never reused, even after old events are pruned
+        '''
+        CREATE TABLE parking_events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT NOT NULL,
+            source TEXT NOT NULL,
+            row_id INTEGER,
+            plate_number TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+        )
+        ''',
+        # Appended by triggers, so every writer feeds it inside its own transaction
+        '''
+        CREATE TRIGGER plates_log_event_insert AFTER INSERT ON plates_log BEGIN
+            INSERT INTO parking_events (event_type, source, row_id, plate_number)
+            VALUES (NEW.action_type, 'plates_log', NEW.id, NEW.plate_number);
+        END
+        ''',
+        '''
+        CREATE TRIGGER plates_log_event_update AFTER UPDATE ON plates_log BEGIN
+            INSERT INTO parking_events (event_type, source, row_id, plate_number)
+            VALUES ('LOG_UPDATE', 'plates_log', NEW.id, NEW.plate_number);
+        END
+        ''',
+        '''
+        CREATE TRIGGER transactions_event_insert AFTER INSERT ON transactions BEGIN
+            INSERT INTO parking_events (event_type, source, row_id, plate_number)
+            VALUES ('PAYMENT', 'transactions', NEW.id, NEW.plate_number);
+        END
+        ''',
+        '''
+        CREATE TRIGGER parking_sessions_event_insert AFTER INSERT ON parking_sessions BEGIN
+            INSERT INTO parking_events (event_type, source, row_id, plate_number)
+            VALUES ('SESSION', 'parking_sessions', NEW.rowid, NEW.plate_number);
+        END
+        ''',
+        '''
+        CREATE TRIGGER parking_sessions_event_update AFTER UPDATE ON parking_sessions BEGIN
+            INSERT INTO parking_events (event_type, source, row_id, plate_number)
+            VALUES ('SESSION', 'parking_sessions', NEW.rowid, NEW.plate_number);
+        END
+        ''',
+    ]),
+    ("hourly and daily statistics rollups", ROLLUP_SCHEMA + backfill_statements()),
+    ("index for history filtered by action", [
+        # /api/events?action=... pages by (entry_timestamp, id) within one action type
+        "CREATE INDEX IF NOT EXISTS idx_plates_log_action_entry ON plates_log (action_type, entry_timestamp)",
+    ]),
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations in one write transaction; safe to run from several processes at once"""
+    if schema_version(conn) >= SCHEMA_VERSION:
+        return 0
+    conn.execute("BEGIN IMMEDIATE")  # take the write lock before re-reading the version
+    try:
+        version = schema_version(conn)
+        for number, (description, statements) in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                conn.execute(statement)
+            print(f"[DB] Migrated schema to version {number}: {description}")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return SCHEMA_VERSION - version
+
+
+def tune(conn):
+    """WAL lets the dashboard read while a lane writes; NORMAL sync is durable enough under WAL"""
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+def connect(db_file=DB_FILE, row_factory=None, upgrade=True, **kwargs):
+    """Open the parking database tuned for concurrent lanes, upgrading its schema first"""
+    os.makedirs(os.path.dirname(db_file) or '.', exist_ok=True)
+    conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT_MS / 1000, **kwargs)
+    if row_factory:
+        conn.row_factory = row_factory
+    tune(conn)
+    if upgrade:
+        migrate(conn)
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parking database schema tool")
+    parser.add_argument('command', choices=('migrate', 'status', 'capacity'), nargs='?', default='status')
+    parser.add_argument('value', type=int, nargs='?', help="number of spaces for 'capacity' (0 = unlimited)")
+    parser.add_argument('--db', default=DB_FILE)
+    args = parser.parse_args()
+
+    conn = connect(args.db, upgrade=False)
+    try:
+        if args.command == 'capacity':
+            migrate(conn)
+            if args.value is not None:
+                with conn:
+                    conn.execute("UPDATE parking_counters SET value = ? WHERE name = 'capacity'", (args.value,))
+            counters = dict(conn.execute("SELECT name, value FROM parking_counters"))
+            print(f"[DB] Capacity {counters['capacity'] or 'unlimited'} | {counters['occupancy']} inside, "
+                  f"{counters['unpaid']} unpaid")
+        elif args.command == 'migrate':
+            applied = migrate(conn)
+            print(f"[DB] {applied} migration(s) applied" if applied else "[DB] Schema already up to date")
+            conn.execute("ANALYZE")
+            conn.commit()
+        version = schema_version(conn)
+        print(f"[DB] {args.db}: schema version {version} of {SCHEMA_VERSION} | "
+              f"journal {conn.execute('PRAGMA journal_mode').fetchone()[0]}")
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"):
+            count = conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+            print(f"  {name}: {count} rows")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+PAYMENT_GRACE = timedelta(minutes=15)  # how long after paying a car may still leave
+
+# One row per plate: its current (or last) stay. exit_timestamp is NULL while the car is inside.
+Session = namedtuple('Session', ['plate_number', 'entry_log_id', 'entry_timestamp', 'payment_status',
+                                 'paid_at', 'paid_until', 'exit_timestamp'])
+SESSION_COLUMNS = ', '.join(Session._fields)
+
+
+def format_timestamp(moment):
+    return moment.isoformat(sep=' ', timespec='seconds')
+
+
+def get_session(conn, plate_number):
+    """Point lookup of a plate's current stay, or None if it never entered"""
+    row = conn.execute(f"SELECT {SESSION_COLUMNS} FROM parking_sessions WHERE plate_number = ?",
+                       (plate_number,)).fetchone()
+    return Session(*row) if row else None
+
+
+def is_inside(session):
+    return session is not None and session.exit_timestamp is None
+
+
+def paid_until(session):
+    """When the car's payment stops covering an exit, or None if this stay is unpaid"""
+    if session is None or session.payment_status != 1 or not session.paid_until:
+        return None
+    return datetime.fromisoformat(session.paid_until)
+
+
+# The writers below don't commit: callers run them in the same transaction as their plates_log write.
+
+def open_session(conn, plate_number, entry_log_id, entry_timestamp):
+    """Start a new unpaid stay, replacing whatever stay the plate had before"""
+    conn.execute('''
+        INSERT INTO parking_sessions (plate_number, entry_log_id, entry_timestamp, payment_status,
+                                      paid_at, paid_until, exit_timestamp)
+        VALUES (?, ?, ?, 0, NULL, NULL, NULL)
+        ON CONFLICT (plate_number) DO UPDATE SET
+            entry_log_id = excluded.entry_log_id, entry_timestamp = excluded.entry_timestamp,
+            payment_status = 0, paid_at = NULL, paid_until = NULL, exit_timestamp = NULL
+    ''', (plate_number, entry_log_id, entry_timestamp))
+
+
+def record_payment(conn, plate_number, paid_at):
+    conn.execute('''
+        UPDATE parking_sessions SET payment_status = 1, paid_at = ?, paid_until = ?
+        WHERE plate_number = ?
+    ''', (format_timestamp(paid_at), format_timestamp(paid_at + PAYMENT_GRACE), plate_number))
+
+
+def read_counters(conn):
+    """{'occupancy', 'unpaid', 'capacity'} kept current by triggers on parking_sessions"""
+    return dict(conn.execute("SELECT name, value FROM parking_counters"))
+
+
+def is_full(counters):
+    return 0 < counters['capacity'] <= counters['occupancy']
+
+
+def close_session(conn, plate_number, exit_timestamp):
+    """Mark the plate's stay as ended; returns False if the car wasn't inside"""
+    cursor = conn.execute('''
+        UPDATE parking_sessions SET exit_timestamp = ?
+        WHERE plate_number = ? AND exit_timestamp IS NULL
+    ''', (exit_timestamp, plate_number))
+    return cursor.rowcount > 0
@@ -0,0 +1,107 @@
+import math
+from collections import defaultdict
+
+LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+DIGITS = '0123456789'
+
+# Rwandan plates: 'RA' + letter + 3 digits + letter, e.g. RAB123C
+PLATE_GRAMMAR = ('R', 'A', LETTERS, DIGITS, DIGITS, DIGITS, LETTERS)
+
+# Characters tesseract confuses, mapped into the class the position requires
+TO_LETTER = {'0': 'O', '1': 'I', '2': 'Z', '4': 'A', '5': 'S', '6': 'G', '7': 'T', '8': 'B'}
+TO_DIGIT = {'O': '0', 'D': '0', 'Q': '0', 'U': '0', 'I': '1', 'L': '1', 'J': '1', 'T': '7',
+            'Z': '2', 'A': '4', 'S': '5', 'G': '6', 'B': '8'}
+CORRECTION_PENALTY = 0.7  # a corrected character is trusted less than a clean read
+DEFAULT_CONFIDENCE = 0.8  # used when the OCR engine gives no per-character confidence
+MIN_CONFIDENCE, MAX_CONFIDENCE = 0.05, 0.99
+
+
+def _fit_position(char, conf, allowed):
+    if char in allowed:
+        return char, conf
+    fixed = (TO_DIGIT if allowed == DIGITS else TO_LETTER).get(char)
+    if fixed and fixed in allowed:
+        return fixed, conf * CORRECTION_PENALTY
+    return None, 0.0
+
+
+def correct_plate(text, confidences=None):
+    """Find the plate in OCR text and fix O/0, I/1, B/8-style confusions by position.
+
+    Tries every 7-character window, corrects each character into the class
+    its position allows and keeps the window that reads as 'RA...' with the
+    highest mean confidence. Returns (plate, per-character confidences) or
+    (None, None).
+    """
+    if confidences is None or len(confidences) != len(text):
+        confidences = [DEFAULT_CONFIDENCE] * len(text)
+    best, best_score = (None, None), -1.0  # below any score, so an all-zero-confidence read still counts
+    for start in range(len(text) - len(PLATE_GRAMMAR) + 1):
+        chars, confs = [], []
+        for char, conf, allowed in zip(text[start:], confidences[start:], PLATE_GRAMMAR):
+            char, conf = _fit_position(char, conf, allowed)
+            if char is None:
+                break
+            chars.append(char)
+            confs.append(conf)
+        else:
+            score = sum(confs) / len(confs)
+            if score > best_score:
+                best, best_score = (''.join(chars), confs), score
+    return best
+
+
+class PlateConsensus:
+    """Per-character-position Bayesian vote over the reads of one plate.
+
+    Each read of a character is treated as correct with its OCR confidence
+    and otherwise as any other character of that position's class; the
+    fixed 'RA' prefix positions carry no uncertainty. The
+    plate's posterior is the product of the per-position posteriors of the
+    winning characters; decide() commits as soon as it crosses threshold, so
+    one or two clean reads are enough while a noisy plate keeps collecting
+    reads up to max_reads.
+    """
+
+    def __init__(self, threshold=0.9, max_reads=6):
+        self.threshold = threshold
+        self.max_reads = max_reads
+        self.reads = 0
+        # {position: {char: log-likelihood}} relative to "none of the reads were right"
+        self._scores = [defaultdict(float) for _ in PLATE_GRAMMAR]
+
+    def add(self, plate, confidences=None):
+        if confidences is None:
+            confidences = [DEFAULT_CONFIDENCE] * len(plate)
+        for position, (char, conf) in enumerate(zip(plate, confidences)):
+            alphabet = len(PLATE_GRAMMAR[position])
+            if alphabet == 1:
+                self._scores[position][char] = 0.0
+                continue
+            conf = min(max(conf, MIN_CONFIDENCE), MAX_CONFIDENCE)
+            # Likelihood ratio of this observation for the observed char vs any other char
+            self._scores[position][char] += math.log(conf * (alphabet - 1) / (1 - conf))
+        self.reads += 1
+
+    def best(self):
+        """Return (plate, posterior) for the most likely plate so far"""
+        if not self.reads:
+            return None, 0.0
+        chars, posterior = [], 1.0
+        for position, scores in enumerate(self._scores):
+            alphabet = len(PLATE_GRAMMAR[position])
+            char = max(scores, key=scores.get)
+            chars.append(char)
+            if alphabet == 1:
+                continue
+            # Chars never observed keep a log-score of 0
+            total = sum(math.exp(score) for score in scores.values()) + (alphabet - len(scores))
+            posterior *= math.exp(scores[char]) / total
+        return ''.join(chars), posterior
+
+    def decide(self):
+        """Return the committed plate once confident enough (or out of reads), else None"""
+        plate, posterior = self.best()
+        if plate and (posterior >= self.threshold or self.reads >= self.max_reads):
+            return plate
+        return None
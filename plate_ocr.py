@@ -0,0 +1,12 @@
+import cv2
+
+PLATE_CHARS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+OCR_CONFIG = f'--psm 8 --oem 3 -c tessedit_char_whitelist={PLATE_CHARS}'
+
+
+def preprocess_plate(plate_img):
+    """Grayscale, blur and Otsu-threshold a plate crop for tesseract"""
+    gray = cv2.cvtColor(plate_img, cv2.COLOR_BGR2GRAY)
+    blur = cv2.GaussianBlur(gray, (5, 5), 0)
+    return cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+
@@ -0,0 +1,180 @@
+import cv2
+
+from plate_consensus import PlateConsensus
+
+
+def box_iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def crop_quality(plate_img):
+    """Bigger and sharper crops score higher: pixel area x variance of the Laplacian"""
+    gray = cv2.cvtColor(plate_img, cv2.COLOR_BGR2GRAY)
+    return gray.size * cv2.Laplacian(gray, cv2.CV_64F).var()
+
+
+class Track:
+    """One physical plate followed across frames"""
+
+    def __init__(self, track_id, box, now):
+        self.track_id = track_id
+        self.box = box
+        self.first_seen = now
+        self.last_seen = now
+        self.missed = 0
+        self.ocr_count = 0
+        self.last_ocr_at = 0.0
+        self.best_quality = 0.0
+
+    def wants_ocr(self, quality, now, max_ocr, refresh_interval):
+        """OCR only crops that beat the best one so far; once the budget is
+        spent, allow one refresh read per interval for cars that sit still"""
+        if (self.ocr_count < max_ocr and quality > self.best_quality) or \
+                now - self.last_ocr_at >= refresh_interval:
+            self.ocr_count += 1
+            self.last_ocr_at = now
+            self.best_quality = max(self.best_quality, quality)
+            return True
+        return False
+
+
+class PlateTracker:
+    """Greedy IoU association of YOLO boxes to plate tracks, with a centroid
+    fallback for small fast-moving boxes that no longer overlap"""
+
+    def __init__(self, iou_threshold=0.3, max_missed=15, max_ocr_per_track=4, refresh_interval=1.0):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.max_ocr_per_track = max_ocr_per_track
+        self.refresh_interval = refresh_interval
+        self.tracks = {}
+        self.total_tracks = 0
+        self.ocr_selected = 0
+        self.ocr_skipped = 0
+        self._next_id = 1
+
+    def update(self, boxes, now):
+        """Match this frame's boxes to tracks; returns [(track, box)] in box order"""
+        pairs = []
+        for t_id, track in self.tracks.items():
+            for i, box in enumerate(boxes):
+                iou = box_iou(track.box, box)
+                if iou >= self.iou_threshold:
+                    pairs.append((iou, t_id, i))
+        pairs.sort(reverse=True)
+
+        matched = {}
+        used_tracks = set()
+        for _, t_id, i in pairs:
+            if t_id not in used_tracks and i not in matched:
+                matched[i] = self.tracks[t_id]
+                used_tracks.add(t_id)
+
+        for i, box in enumerate(boxes):
+            if i in matched:
+                continue
+            track = self._nearest_centroid(box, used_tracks)
+            if track is None:
+                track = Track(self._next_id, box, now)
+                self.tracks[track.track_id] = track
+                self._next_id += 1
+                self.total_tracks += 1
+            matched[i] = track
+            used_tracks.add(track.track_id)
+
+        for t_id in list(self.tracks):
+            if t_id not in used_tracks:
+                track = self.tracks[t_id]
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    del self.tracks[t_id]
+
+        assigned = []
+        for i, box in enumerate(boxes):
+            track = matched[i]
+            track.box = box
+            track.last_seen = now
+            track.missed = 0
+            assigned.append((track, box))
+        return assigned
+
+    def select_for_ocr(self, track, plate_img, now):
+        if track.wants_ocr(crop_quality(plate_img), now, self.max_ocr_per_track, self.refresh_interval):
+            self.ocr_selected += 1
+            return True
+        self.ocr_skipped += 1
+        return False
+
+    def report(self):
+        return (f"[TRACKER] {len(self.tracks)} active / {self.total_tracks} tracks | "
+                f"OCR {self.ocr_selected} crops, skipped {self.ocr_skipped}")
+
+    def _nearest_centroid(self, box, used_tracks):
+        cx, cy = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+        best, best_dist = None, None
+        for t_id, track in self.tracks.items():
+            if t_id in used_tracks:
+                continue
+            tx, ty = (track.box[0] + track.box[2]) / 2, (track.box[1] + track.box[3]) / 2
+            limit = max(track.box[2] - track.box[0], track.box[3] - track.box[1])
+            dist = ((cx - tx) ** 2 + (cy - ty) ** 2) ** 0.5
+            if dist <= limit and (best_dist is None or dist < best_dist):
+                best, best_dist = track, dist
+        return best
+
+
+class TrackVotes:
+    """Per-track plate consensus, so reads from different cars never mix.
+
+    Each track commits one decision as soon as its PlateConsensus is
+    confident enough; later reads of a decided track are ignored. Reads the
+    OCR cache reused from an earlier crop repeat a read already counted, so
+    they keep the track alive but never add a vote. State of tracks that
+    stopped producing reads is dropped after idle_timeout seconds.
+    """
+
+    def __init__(self, threshold=0.9, max_reads=6, idle_timeout=30):
+        self.threshold = threshold
+        self.max_reads = max_reads
+        self.idle_timeout = idle_timeout
+        self._votes = {}  # {track_id: PlateConsensus}
+        self._last_vote = {}  # {track_id: timestamp}
+        self._decided = {}  # {track_id: timestamp}
+        self.decisions = 0
+        self.reads_decided = 0
+
+    def add(self, track_id, plate, now, confidences=None, cached=False):
+        """Record a read; returns the consensus plate once the track is decided"""
+        self._prune(now)
+        self._last_vote[track_id] = now
+        if track_id in self._decided or cached:
+            return None
+        consensus = self._votes.get(track_id)
+        if consensus is None:
+            consensus = self._votes[track_id] = PlateConsensus(self.threshold, self.max_reads)
+        consensus.add(plate, confidences)
+        decided = consensus.decide()
+        if decided is None:
+            return None
+
+        del self._votes[track_id]
+        self.decisions += 1
+        self.reads_decided += consensus.reads
+        if track_id is not None:  # untracked reads keep voting in rounds, as before
+            self._decided[track_id] = now
+        return decided
+
+    def report(self):
+        average = self.reads_decided / self.decisions if self.decisions else 0
+        return f"[VOTES] {self.decisions} plates decided | {average:.1f} reads per decision"
+
+    def _prune(self, now):
+        for track_id, last in list(self._last_vote.items()):
+            if now - last > self.idle_timeout:
+                self._votes.pop(track_id, None)
+                self._decided.pop(track_id, None)
+                del self._last_vote[track_id]
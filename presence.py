@@ -0,0 +1,127 @@
+import logging
+import re
+import time
+
+import cv2
+import numpy as np
+
+PRESENCE_DISTANCE = 50  # cm; closer than this counts as a vehicle at the gate
+PRESENCE_MODES = ('auto', 'serial', 'motion')
+
+# "DIST:32" from the motor sketch, or its older "[INFO] Object Approaching: 32 cm"
+DISTANCE_PATTERN = re.compile(r'(?:DIST:|Object Approaching:\s*)(-?\d+)')
+
+log = logging.getLogger(__name__)
+
+
+class UltrasonicPresence:
+    """Presence from the gate Arduino's ultrasonic sensor.
+
+    The device's reader thread hands over the distance lines the motor
+    sketch prints, and the lane is armed while the latest reading is within
+    max_distance, plus a short hold so a single bad echo doesn't drop a waiting car.
+    """
+
+    def __init__(self, arduino, max_distance=PRESENCE_DISTANCE, hold=2.0, stale_after=2.0):
+        self.arduino = arduino
+        self.max_distance = max_distance
+        self.hold = hold
+        self.stale_after = stale_after  # readings older than this are ignored
+        self.distance = None
+        self.present = False
+        self._last_reading = 0.0
+        self._last_near = 0.0
+
+    def start(self):
+        self.arduino.subscribe(self.feed_line)
+
+    def stop(self):
+        self.arduino.unsubscribe(self.feed_line)
+
+    def feed_line(self, line):
+        match = DISTANCE_PATTERN.search(line)
+        if not match:
+            return
+        distance = int(match.group(1))
+        now = time.monotonic()
+        self.distance = distance
+        self._last_reading = now
+        if 0 < distance <= self.max_distance:
+            self._last_near = now
+
+    def __call__(self, frame):
+        now = time.monotonic()
+        present = now - self._last_reading <= self.stale_after and now - self._last_near <= self.hold
+        if present != self.present:
+            self.present = present
+            if present:
+                log.info("[SENSOR] Vehicle arrived (%s cm)", self.distance)
+            else:
+                log.info("[SENSOR] Lane clear")
+        return present
+
+
+class MotionPresence:
+    """Presence from frame differencing against a background model on a
+    downscaled grayscale frame.
+
+    The background only learns while the lane is empty, so a car waiting
+    still at the barrier stays "present"; after max_present seconds it
+    learns again so a parked object or lighting change cannot arm the lane
+    forever.
+    """
+
+    def __init__(self, width=160, threshold=25, min_area=0.02, hold=2.0, max_present=120, learning_rate=0.02):
+        self.width = width
+        self.threshold = threshold  # grey-level change that counts as a changed pixel
+        self.min_area = min_area  # fraction of changed pixels that counts as a vehicle
+        self.hold = hold
+        self.max_present = max_present
+        self.learning_rate = learning_rate
+        self.present = False
+        self._background = None
+        self._last_change = 0.0
+        self._present_since = 0.0
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def __call__(self, frame):
+        height, width = frame.shape[:2]
+        small = cv2.resize(frame, (self.width, max(1, height * self.width // width)), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        if self._background is None:
+            self._background = gray.astype(np.float32)
+            return False
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self._background))
+        changed = np.count_nonzero(diff > self.threshold) / diff.size
+        now = time.monotonic()
+        if changed >= self.min_area:
+            self._last_change = now
+        present = now - self._last_change <= self.hold
+
+        if present != self.present:
+            self.present = present
+            self._present_since = now
+            if present:
+                log.info("[SENSOR] Vehicle arrived (%.0f%% of frame changed)", changed * 100)
+            else:
+                log.info("[SENSOR] Lane clear")
+        if not present or now - self._present_since > self.max_present:
+            cv2.accumulateWeighted(gray, self._background, self.learning_rate)
+        return present
+
+
+def make_presence(mode, arduino):
+    """'serial' uses the gate Arduino's ultrasonic sensor, 'motion' the camera;
+    'auto' picks serial when the Arduino is connected at startup"""
+    if mode == 'serial' or (mode == 'auto' and arduino and arduino.connected):
+        if not arduino:
+            log.warning("[WARNING] Serial presence requested without an Arduino; falling back to motion")
+            return MotionPresence()
+        return UltrasonicPresence(arduino)
+    return MotionPresence()
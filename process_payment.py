@@ -1,84 +1,64 @@
-import sqlite3
-import os
-import time
-import platform
-import serial
-import serial.tools.list_ports
+import queue
+from collections import namedtuple
 from datetime import datetime
+import parking_db
+from parking_sessions import PAYMENT_GRACE, format_timestamp, get_session, record_payment
+from lane_log import setup_logging
+from serial_manager import SerialDevice
 
 # Config
-db_file = "data/parking.db"
 RATE_PER_HOUR = 500  # RWF per hour
-ser = None
-
-# SQLite3 database setup
-os.makedirs(os.path.dirname(db_file), exist_ok=True)
-conn = sqlite3.connect(db_file)
+PAY_REPLY_TIMEOUT = 3.0  # seconds for the card reader to write the new balance and answer DONE or FAIL
+PAY_REPLIES = ('DONE', 'FAIL')
+device = None
+
+# Everything that touches the database happens on this loop: card lines and finished PAY exchanges
+# arrive here from the device's reader thread, so the loop never waits on the port itself
+events = queue.Queue()
+paying = set()  # plates with a PAY sent and no answer yet, so a second tap can't charge the card twice
+Payment = namedtuple('Payment', ['plate', 'session', 'entry_time', 'now', 'already_paid', 'last_exit_time',
+                                 'duration_hours', 'amount_due'])
+
+# SQLite3 database setup (schema, indexes and WAL live in parking_db)
+conn = parking_db.connect()
 cursor = conn.cursor()
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS plates_log (
-    plate_number TEXT,
-    payment_status INTEGER,
-    entry_timestamp TEXT,
-    exit_timestamp TEXT,
-    action_type TEXT
-)
-''')
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS transactions (
-    plate_number TEXT,
-    entry_time TEXT,
-    exit_time TEXT,
-    duration_hr REAL,
-    amount INTEGER,
-    payment_status INTEGER
-)
-''')
-conn.commit()
-
-def detect_arduino_port():
-    ports = list(serial.tools.list_ports.comports())
-    system = platform.system()
-
-    for port in ports:
-        port_name = port.device
-        if (
-            ("ttyACM" in port_name or "ttyUSB" in port_name) and system == "Linux" or
-            ("usbmodem" in port_name or "wchusbserial" in port_name) and system == "Darwin" or
-            ("COM" in port_name) and system == "Windows"
-        ):
-            return port_name
-    return None
 
-def listen_to_arduino(arduino_port, baud=115200):
-    global ser
+def listen_to_arduino(arduino_port=None):
+    global device
+    device = SerialDevice(arduino_port, name='payment')
+    device.subscribe(lambda line: events.put(('line', line)))
+    device.start()
+    print(f"🔌 Listening on {device}...")
     try:
-        ser = serial.Serial(arduino_port, baud, timeout=2)
-        time.sleep(2)
-        print(f"🔌 Listening on {arduino_port}...")
-
         while True:
-            line = ser.readline().decode('utf-8').strip()
-            if line:
-                print("📨 Received:", line)
-                process_message(line)
-
-    except serial.SerialException as e:
-        print("❌ Serial error:", e)
+            try:
+                event = events.get(timeout=1)  # wakes now and then so Ctrl+C gets through on Windows
+            except queue.Empty:
+                continue
+            if event[0] == 'line':
+                print("📨 Received:", event[1])
+                process_message(event[1])
+            else:
+                finish_payment(*event[1:])
     except KeyboardInterrupt:
         print("\n🔚 Exiting...")
     finally:
-        if 'ser' in locals() and ser.is_open:
-            ser.close()
+        device.stop()
 
 def process_message(message):
-    if "PLATE:" in message and "BALANCE:" in message:
+    if message in PAY_REPLIES:
+        # The reply to a PAY that already timed out: the card may have been charged without a transaction
+        print(f"⚠️ Late payment reply '{message}' after {PAY_REPLY_TIMEOUT}s; check the card's balance.")
+    elif "PLATE:" in message and "BALANCE:" in message:
         try:
             parts = message.split("|")
             plate = parts[0].split("PLATE:")[1]
             balance = int(parts[1].split("BALANCE:")[1])
             print(f"✅ Plate: {plate} | Balance: {balance} RWF")
 
+            if plate in paying:
+                print("⏳ Payment already in progress for this plate; ignoring.")
+                return
             entry_time = lookup_entry_time(plate)
             if entry_time:
                 compute_and_log_payment(plate, entry_time, balance)
@@ -90,32 +70,34 @@ def process_message(message):
         print("⚠️ Unrecognized format.")
 
 def lookup_entry_time(plate):
-    cursor.execute("SELECT entry_timestamp FROM plates_log WHERE plate_number = ? ORDER BY entry_timestamp DESC LIMIT 1", (plate,))
-    row = cursor.fetchone()
-    if row:
-        return datetime.fromisoformat(row[0])
+    session = get_session(conn, plate)
+    if session and session.entry_timestamp:
+        return datetime.fromisoformat(session.entry_timestamp)
     return None
 
-def update_payment_status_in_log(plate, exit_time, action_type="EXIT"):
-    cursor.execute("UPDATE plates_log SET payment_status = 1, exit_timestamp = ?, action_type = ? WHERE plate_number = ? AND payment_status = 0", (exit_time.isoformat(sep=' '), action_type, plate))
-    conn.commit()
-    print("📝 Updated plates_log with full exit info")
+def update_payment_status_in_log(entry_log_id):
+    """Mark the stay's ENTRY row paid; runs inside the caller's payment transaction.
+
+    The row stays ENTRY until the exit gate lets the car out and turns it into
+    EXIT, so exits and stay lengths are counted when the car actually leaves.
+    """
+    cursor.execute("UPDATE plates_log SET payment_status = 1 WHERE id = ?", (entry_log_id,))
+    print("📝 Marked plates_log entry paid")
 
 def compute_and_log_payment(plate, entry_time, balance):
     now = datetime.now()
     already_paid = False
     last_exit_time = None
 
-    # Check last payment record
-    cursor.execute("SELECT exit_timestamp FROM plates_log WHERE plate_number = ? AND payment_status = 1 ORDER BY entry_timestamp DESC LIMIT 1", (plate,))
-    row = cursor.fetchone()
-    if row:
-        last_exit_time = datetime.fromisoformat(row[0])
+    # Payment state of the current stay
+    session = get_session(conn, plate)
+    if session and session.payment_status == 1 and session.paid_at:
+        last_exit_time = datetime.fromisoformat(session.paid_at)
         already_paid = True
 
     if already_paid:
-        time_diff = (now - last_exit_time).total_seconds() / 60
-        if time_diff <= 15:
+        time_diff = now - last_exit_time
+        if time_diff <= PAYMENT_GRACE:
             print("🕒 Already paid. Exit within 15 minutes, no extra charge.")
             return
         else:
@@ -137,35 +119,39 @@ def compute_and_log_payment(plate, entry_time, balance):
         print("❌ Insufficient balance!")
         return
 
-    # Send payment command to Arduino
+    # Send payment command to Arduino; the reply comes back through the event loop
     command = f"PAY:{amount_due}\n"
     print(f"➡️ Sending command to Arduino: {command.strip()}")
-    global ser
-    ser.write(command.encode())
-    ser.flush()
-
-    response = ser.readline().decode().strip()
+    payment = Payment(plate, session, entry_time, now, already_paid, last_exit_time, duration_hours, amount_due)
+    paying.add(plate)  # until finish_payment, which runs on DONE, FAIL, timeout or disconnect alike
+    reply = device.request(command, lambda line: line in PAY_REPLIES, PAY_REPLY_TIMEOUT)
+    reply.add_done_callback(lambda future: events.put(('reply', payment, future)))
+
+def finish_payment(payment, reply):
+    """Record a payment once the card reader has answered its PAY command"""
+    paying.discard(payment.plate)
+    try:
+        response = reply.result()
+    except (TimeoutError, ConnectionError) as e:
+        response = e
     if response == "DONE":
         print("✅ Payment completed by Arduino.")
 
-        if not already_paid:
-            update_payment_status_in_log(plate, now)
+        # Log row, transaction and session commit together
+        with conn:
+            if not payment.already_paid:
+                update_payment_status_in_log(payment.session.entry_log_id)
 
-        # Log the transaction in the transactions table
-        cursor.execute("INSERT INTO transactions (plate_number, entry_time, exit_time, duration_hr, amount, payment_status) VALUES (?, ?, ?, ?, ?, ?)",
-                       (plate, entry_time.isoformat() if not already_paid else last_exit_time.isoformat(), now.isoformat(), duration_hours, amount_due, 1))
-        conn.commit()
+            # Log the transaction in the transactions table
+            start = payment.last_exit_time if payment.already_paid else payment.entry_time
+            cursor.execute("INSERT INTO transactions (plate_number, entry_time, exit_time, duration_hr, amount, payment_status) VALUES (?, ?, ?, ?, ?, ?)",
+                           (payment.plate, format_timestamp(start), format_timestamp(payment.now), payment.duration_hours, payment.amount_due, 1))
 
-        # Update the exit timestamp and payment status in the plates_log table
-        cursor.execute("UPDATE plates_log SET exit_timestamp = ?, payment_status = 1 WHERE plate_number = ? AND payment_status = 0", (now.isoformat(), plate))
-        conn.commit()
+            record_payment(conn, payment.plate, payment.now)
     else:
         print(f"❌ Payment failed or no DONE signal: {response}")
 
 if __name__ == "__main__":
-    port = detect_arduino_port()
-    if port:
-        listen_to_arduino(port)
-    else:
-        print("❌ No Arduino port found.")
+    setup_logging()  # serial connects, drops and reconnects are logged
+    listen_to_arduino()  # auto-detects the card reader and waits for it to be plugged in
     conn.close()
\ No newline at end of file
@@ -0,0 +1,208 @@
+import argparse
+from datetime import datetime, timedelta
+
+from archive import archive_months, archive_path, attached, main_db_file
+
+# {granularity: (table, strftime format of its bucket)}
+ROLLUPS = {
+    'hour': ('stats_hourly', '%Y-%m-%d %H:00'),
+    'day': ('stats_daily', '%Y-%m-%d'),
+}
+ROLLUP_COLUMNS = ('entries', 'exits', 'unauthorized', 'revenue', 'stays', 'stay_seconds')
+# Columns a backfill reads from the hot tables and the monthly archives
+BACKFILL_SOURCES = {
+    'plates_log': ('plate_number', 'entry_timestamp', 'exit_timestamp', 'action_type'),
+    'transactions': ('exit_time', 'amount'),
+}
+
+
+def _create_table(table):
+    return f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            bucket TEXT PRIMARY KEY,
+            entries INTEGER NOT NULL DEFAULT 0,
+            exits INTEGER NOT NULL DEFAULT 0,
+            unauthorized INTEGER NOT NULL DEFAULT 0,
+            revenue INTEGER NOT NULL DEFAULT 0,
+            stays INTEGER NOT NULL DEFAULT 0,
+            stay_seconds REAL NOT NULL DEFAULT 0
+        )
+    '''
+
+
+def _bump(timestamp, **increments):
+    """Upsert statements adding increments to the hourly and daily buckets of timestamp"""
+    columns = ', '.join(increments)
+    updates = ', '.join(f"{column} = {column} + excluded.{column}" for column in increments)
+    statements = []
+    for table, fmt in ROLLUPS.values():
+        values = ', '.join(str(value) for value in increments.values())
+        statements.append(f"INSERT INTO {table} (bucket, {columns}) "
+                          f"SELECT strftime('{fmt}', {timestamp}), {values} "
+                          f"WHERE strftime('{fmt}', {timestamp}) IS NOT NULL "
+                          f"ON CONFLICT (bucket) DO UPDATE SET {updates};")
+    return '\n'.join(statements)
+
+
+STAY_SECONDS = "(julianday(NEW.exit_timestamp) - julianday(NEW.entry_timestamp)) * 86400"
+
+# Triggers keep the rollups current inside each writer's transaction. An exit is a
+# plates_log row becoming EXIT: the exit gate letting a stay out (older rows were turned
+# into EXIT by the kiosk at payment time), or an EXIT row inserted by older lane code.
+ROLLUP_SCHEMA = [_create_table(table) for table, _ in ROLLUPS.values()] + [
+    f'''
+    CREATE TRIGGER plates_log_rollup_entry AFTER INSERT ON plates_log WHEN NEW.action_type = 'ENTRY' BEGIN
+        {_bump('NEW.entry_timestamp', entries=1)}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER plates_log_rollup_exit AFTER INSERT ON plates_log WHEN NEW.action_type = 'EXIT' BEGIN
+        {_bump('NEW.exit_timestamp', exits=1, stays=1, stay_seconds=STAY_SECONDS)}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER plates_log_rollup_paid_exit AFTER UPDATE OF action_type ON plates_log
+    WHEN NEW.action_type = 'EXIT' AND OLD.action_type <> 'EXIT' BEGIN
+        {_bump('NEW.exit_timestamp', exits=1, stays=1, stay_seconds=STAY_SECONDS)}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER plates_log_rollup_unauthorized AFTER INSERT ON plates_log
+    WHEN NEW.action_type = 'UNAUTHORIZED_EXIT' BEGIN
+        {_bump('NEW.exit_timestamp', unauthorized=1)}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER transactions_rollup_revenue AFTER INSERT ON transactions BEGIN
+        {_bump('NEW.exit_time', revenue='NEW.amount')}
+    END
+    ''',
+]
+
+
+def backfill_statements(plates_log='plates_log', transactions='transactions'):
+    """Statements rebuilding every rollup from plates_log and transactions (or copies of them)"""
+    statements = []
+    for table, fmt in ROLLUPS.values():
+        statements.append(f"DELETE FROM {table}")
+        statements.append(f'''
+            INSERT INTO {table} (bucket, entries, exits, unauthorized, revenue, stays, stay_seconds)
+            SELECT bucket, SUM(entries), SUM(exits), SUM(unauthorized), SUM(revenue), SUM(stays), SUM(stay_seconds)
+            FROM (
+                -- Older lane code left the ENTRY row and added an EXIT row; the exit gate (and the kiosk
+                -- before it) turns the ENTRY row itself into EXIT, so an EXIT row without its ENTRY
+                -- sibling also marks an entry
+                SELECT strftime('{fmt}', entry_timestamp) AS bucket, 1 AS entries, 0 AS exits, 0 AS unauthorized,
+                       0 AS revenue, 0 AS stays, 0 AS stay_seconds
+                FROM {plates_log} AS p
+                WHERE action_type = 'ENTRY'
+                   OR (action_type = 'EXIT' AND NOT EXISTS (
+                        SELECT 1 FROM {plates_log}
+                        WHERE plate_number = p.plate_number AND action_type = 'ENTRY'
+                          AND entry_timestamp = p.entry_timestamp))
+                UNION ALL
+                SELECT strftime('{fmt}', exit_timestamp), 0, 1, 0, 0, 1,
+                       (julianday(exit_timestamp) - julianday(entry_timestamp)) * 86400
+                FROM {plates_log} WHERE action_type = 'EXIT'
+                UNION ALL
+                SELECT strftime('{fmt}', exit_timestamp), 0, 0, 1, 0, 0, 0
+                FROM {plates_log} WHERE action_type = 'UNAUTHORIZED_EXIT'
+                UNION ALL
+                SELECT strftime('{fmt}', exit_time), 0, 0, 0, amount, 0, 0
+                FROM {transactions}
+            )
+            WHERE bucket IS NOT NULL
+            GROUP BY bucket
+        ''')
+    return statements
+
+
+def backfill(conn):
+    """Rebuild every rollup from the hot database and its monthly archives.
+
+    The rows the rollups need are gathered into TEMP copies first, each
+    archive attached in turn, so a stay counts whichever file holds it. Run
+    it while archive.py is not moving rows, or a batch moved mid-backfill
+    can be counted twice.
+    """
+    db_file = main_db_file(conn)
+    for table, columns in BACKFILL_SOURCES.items():
+        conn.execute(f"DROP TABLE IF EXISTS temp.rollup_{table}")
+        conn.execute(f"CREATE TEMP TABLE rollup_{table} AS SELECT {', '.join(columns)} FROM main.{table}")
+    for month in archive_months(db_file):
+        # Writable attach: read-only needs a uri=True connection, and nothing is written to it
+        with attached(conn, archive_path(db_file, month), read_only=False) as schema:
+            for table, columns in BACKFILL_SOURCES.items():
+                conn.execute(f"INSERT INTO temp.rollup_{table} SELECT {', '.join(columns)} FROM {schema}.{table}")
+            conn.commit()  # only the TEMP copies; DETACH can't happen inside a transaction
+    conn.execute("CREATE INDEX temp.idx_rollup_plates_log ON rollup_plates_log "
+                 "(plate_number, action_type, entry_timestamp)")
+    try:
+        with conn:
+            for statement in backfill_statements('temp.rollup_plates_log', 'temp.rollup_transactions'):
+                conn.execute(statement)
+    finally:
+        for table in BACKFILL_SOURCES:
+            conn.execute(f"DROP TABLE IF EXISTS temp.rollup_{table}")
+
+
+def query_rollups(conn, granularity='hour', start=None, end=None):
+    """Rollup rows for buckets in [start, end) (datetimes or bucket strings), oldest first"""
+    table, fmt = ROLLUPS[granularity]
+    if isinstance(start, datetime):
+        start = start.strftime(fmt)
+    if isinstance(end, datetime):
+        end = end.strftime(fmt)
+    rows = conn.execute(f'''
+        SELECT bucket, {', '.join(ROLLUP_COLUMNS)}
+        FROM {table}
+        WHERE bucket >= COALESCE(?, '') AND (? IS NULL OR bucket < ?)
+        ORDER BY bucket
+    ''', (start, end, end)).fetchall()
+    stats = []
+    for row in rows:
+        stat = dict(zip(('bucket',) + ROLLUP_COLUMNS, row))
+        stat['avg_stay_minutes'] = round(stat['stay_seconds'] / stat['stays'] / 60, 1) if stat['stays'] else None
+        stats.append(stat)
+    return stats
+
+
+def last_24_hours(conn, now=None):
+    """Per-hour-of-day entries over the last 24 hours, for the dashboard chart"""
+    now = now or datetime.now()
+    start = (now - timedelta(hours=23)).replace(minute=0, second=0, microsecond=0)
+    entries = {row['bucket'][11:13]: row['entries'] for row in query_rollups(conn, 'hour', start)}
+    return [{'hour': f"{hour:02d}", 'entries': entries.get(f"{hour:02d}", 0)} for hour in range(24)]
+
+
+def revenue_on(conn, day=None):
+    bucket = (day or datetime.now()).strftime(ROLLUPS['day'][1])
+    row = conn.execute("SELECT revenue FROM stats_daily WHERE bucket = ?", (bucket,)).fetchone()
+    return row[0] if row else 0
+
+
+def main():
+    import parking_db
+
+    parser = argparse.ArgumentParser(description="Rebuild (archives included) or show the hourly/daily statistics rollups")
+    parser.add_argument('command', choices=('backfill', 'show'), nargs='?', default='show')
+    parser.add_argument('--db', default=parking_db.DB_FILE)
+    parser.add_argument('--granularity', choices=tuple(ROLLUPS), default='day')
+    parser.add_argument('--from', dest='start', help="first bucket, e.g. 2025-06-01")
+    parser.add_argument('--to', dest='end', help="bucket to stop before")
+    args = parser.parse_args()
+
+    conn = parking_db.connect(args.db)
+    try:
+        if args.command == 'backfill':
+            backfill(conn)
+            print("[ROLLUPS] Rebuilt hourly and daily statistics")
+        for stat in query_rollups(conn, args.granularity, args.start, args.end):
+            print(f"{stat['bucket']}: {stat['entries']} in, {stat['exits']} out, {stat['unauthorized']} unauthorized, "
+                  f"{stat['revenue']} RWF, avg stay {stat['avg_stay_minutes']} min")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
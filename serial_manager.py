@@ -0,0 +1,302 @@
+import logging
+import platform
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import serial
+import serial.tools.list_ports
+
+from metrics import SERIAL_CONNECTED, SERIAL_RECONNECTS, SERIAL_REPLIES
+
+BAUD_RATE = 115200
+READ_TIMEOUT = 0.1  # seconds a readline may wait, which bounds how fast stop() and reply timeouts react
+WRITE_TIMEOUT = 0.5
+SETTLE_TIME = 1.0  # the board resets when the port opens; commands wait this long instead of the caller
+RECONNECT_BACKOFF = (0.5, 10.0)  # first and longest wait between attempts to (re)open the port
+CONNECT_WAIT = 2.0  # seconds connect_arduino gives a new device to come up before the lane starts
+SEND_QUEUE_SIZE = 64
+
+log = logging.getLogger(__name__)
+
+_claimed_ports = set()  # ports held by a device in this process, so auto-detection skips them
+_claimed_lock = threading.Lock()
+
+
+def is_arduino_port(name, system=None):
+    system = system or platform.system()
+    if system == 'Darwin':
+        return 'usbmodem' in name or 'wchusbserial' in name
+    if system == 'Windows':
+        return 'COM' in name
+    return 'ttyACM' in name or 'ttyUSB' in name
+
+
+def detect_arduino_port():
+    """First Arduino-looking serial port that no device in this process holds, or None"""
+    with _claimed_lock:
+        for port in serial.tools.list_ports.comports():
+            if is_arduino_port(port.device) and port.device not in _claimed_ports:
+                return port.device
+    return None
+
+
+class SerialDevice:
+    """One Arduino behind its own reader and writer threads.
+
+    Nothing here blocks the caller: send() queues a command for the writer,
+    lines read from the board go to subscribers, and request() returns a
+    Future resolved by the reply line. The reader owns the connection: it
+    opens the port (auto-detecting it when none is given), and when the
+    board is unplugged or a read fails it closes it and retries with
+    exponential backoff until the board comes back.
+    """
+
+    def __init__(self, port=None, name='arduino', baud=BAUD_RATE, settle=SETTLE_TIME, backoff=RECONNECT_BACKOFF):
+        self.port = port  # fixed port, or None to auto-detect on every attempt
+        self.name = name  # metrics label
+        self.baud = baud
+        self.settle = settle
+        self.backoff = backoff
+        self.running = False
+        self._serial = None
+        self._serial_port = None
+        self._ready_at = 0.0  # monotonic time the board has booted after opening
+        self._lock = threading.Lock()  # guards _serial, _subscribers and _pending
+        self._connected = threading.Event()
+        self._stop = threading.Event()
+        self._commands = queue.Queue(SEND_QUEUE_SIZE)
+        self._subscribers = []
+        self._pending = []  # [(match, deadline, future)] oldest first
+        self._threads = []
+        SERIAL_CONNECTED.set_function(lambda: int(self.connected), device=name)
+
+    def __str__(self):
+        return f"{self.name} ({self._serial_port or self.port or 'auto-detect'})"
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def start(self):
+        self.running = True
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._read_loop, name=f"serial-{self.name}-read", daemon=True),
+                         threading.Thread(target=self._write_loop, name=f"serial-{self.name}-write", daemon=True)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """Send whatever is still queued (a closing gate), then close the port"""
+        self.running = False
+        self._commands.put(None)  # wakes the writer, which drains the queue first
+        reader, writer = self._threads or (None, None)
+        if writer:
+            writer.join(timeout=2)
+        self._stop.set()
+        if reader:
+            reader.join(timeout=2)
+        self._threads = []
+        self._disconnect(None)
+
+    def wait_connected(self, timeout):
+        return self._connected.wait(timeout)
+
+    # ===== Commands =====
+    def send(self, command):
+        """Queue command for the writer; False if the board is not connected or the queue is full.
+
+        Commands are not kept for a board that is away: a gate opened minutes
+        later, after a reconnect, would let through whoever is there by then.
+        """
+        if not self.connected or not self.running:
+            return False
+        try:
+            self._commands.put_nowait(command)
+            return True
+        except queue.Full:
+            log.warning("[SERIAL] %s: command queue full, dropping '%s'", self, command.strip())
+            return False
+
+    def request(self, command, match, timeout):
+        """Send command and return a Future for the first line match(line) accepts within timeout seconds.
+
+        The Arduino sketches don't number their messages, so replies are
+        correlated by order: each line goes to the oldest pending request that
+        matches it and is not seen by subscribers. The Future fails with
+        TimeoutError if no reply comes, and ConnectionError if the command
+        could not be queued or the board went away first.
+        """
+        future = Future()
+        entry = (match, time.monotonic() + timeout, future)
+        with self._lock:
+            self._pending.append(entry)
+        if not self.send(command):
+            self._fail(entry, ConnectionError(f"{self} is not connected"))
+        return future
+
+    # ===== Lines =====
+    def subscribe(self, callback):
+        """Call callback(line) from the reader thread for every line no request claimed; keep it quick"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    # ===== Connection =====
+    def _connect(self):
+        port = self.port or detect_arduino_port()
+        if not port:
+            raise serial.SerialException("no Arduino port found")
+        with _claimed_lock:
+            _claimed_ports.add(port)
+        try:
+            connection = serial.Serial(port, self.baud, timeout=READ_TIMEOUT, write_timeout=WRITE_TIMEOUT,
+                                       bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE,
+                                       stopbits=serial.STOPBITS_ONE)
+            connection.reset_input_buffer()
+            connection.reset_output_buffer()
+        except Exception:
+            with _claimed_lock:
+                _claimed_ports.discard(port)
+            raise
+        with self._lock:
+            self._serial, self._serial_port = connection, port
+            self._ready_at = time.monotonic() + self.settle
+        self._connected.set()
+        log.info("[CONNECTED] %s", self)
+
+    def _disconnect(self, error):
+        with self._lock:
+            connection, port = self._serial, self._serial_port
+            self._serial = None
+            pending, self._pending = self._pending, []
+        self._connected.clear()
+        for _, _, future in pending:
+            SERIAL_REPLIES.inc(device=self.name, result='failed')
+            future.set_exception(ConnectionError(f"{self.name} disconnected"))
+        if connection is None:
+            return
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with _claimed_lock:
+            _claimed_ports.discard(port)
+        if error is not None:
+            log.error("[SERIAL] %s on %s lost: %s", self.name, port, error)
+
+    def _read_loop(self):
+        delay = self.backoff[0]
+        attempts = 0
+        while self.running:
+            connection = self._serial
+            if connection is None:
+                try:
+                    self._connect()
+                    delay = self.backoff[0]
+                    if attempts:
+                        SERIAL_RECONNECTS.inc(device=self.name)
+                    attempts += 1
+                    continue
+                except Exception as e:
+                    if delay == self.backoff[0]:  # say it once per outage, not on every retry
+                        log.warning("[SERIAL] %s unavailable (%s); retrying with backoff", self, e)
+                    self._stop.wait(delay)
+                    delay = min(delay * 2, self.backoff[1])
+                    continue
+            try:
+                raw = connection.readline()
+            except Exception as e:  # unplugged: readline raises once the device node is gone
+                if self.running:
+                    self._disconnect(e)
+                continue
+            self._expire()
+            line = raw.decode('utf-8', errors='ignore').strip()
+            if line:
+                self._dispatch(line)
+
+    def _write_loop(self):
+        while True:
+            command = self._commands.get()
+            batch = [] if command is None else [command]
+            while True:  # commands queued together go out in one write
+                try:
+                    command = self._commands.get_nowait()
+                except queue.Empty:
+                    break
+                if command is not None:
+                    batch.append(command)
+            if batch:
+                self._write(batch)
+            if not self.running and self._commands.empty():
+                return
+
+    def _write(self, batch):
+        connection = self._serial
+        if connection is None:
+            log.error("[SERIAL] %s not connected; dropped %s", self.name, [c.strip() for c in batch])
+            return
+        wait = self._ready_at - time.monotonic()
+        if wait > 0:
+            self._stop.wait(wait)
+        try:
+            connection.write(''.join(batch).encode())  # no flush(): the OS sends it, this thread has no reason to wait
+            log.debug("[ARDUINO] Sent: %s", ', '.join(c.strip() for c in batch))
+        except Exception as e:
+            self._disconnect(e)
+
+    # ===== Replies =====
+    def _dispatch(self, line):
+        with self._lock:
+            for entry in self._pending:
+                if entry[0](line):
+                    self._pending.remove(entry)
+                    break
+            else:
+                entry = None
+                subscribers = list(self._subscribers)
+        if entry is not None:
+            SERIAL_REPLIES.inc(device=self.name, result='matched')
+            entry[2].set_result(line)
+            return
+        for callback in subscribers:
+            try:
+                callback(line)
+            except Exception as e:
+                log.error("[SERIAL] %s subscriber failed on %r: %s", self.name, line, e)
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [entry for entry in self._pending if entry[1] <= now]
+            for entry in expired:
+                self._pending.remove(entry)
+        for entry in expired:
+            SERIAL_REPLIES.inc(device=self.name, result='timeout')
+            entry[2].set_exception(TimeoutError(f"no reply from {self.name}"))
+
+    def _fail(self, entry, error):
+        with self._lock:
+            if entry not in self._pending:
+                return
+            self._pending.remove(entry)
+        SERIAL_REPLIES.inc(device=self.name, result='failed')
+        entry[2].set_exception(error)
+
+
+def connect_arduino(port=None, name='arduino', wait=CONNECT_WAIT):
+    """Start a device on port (auto-detected if None), giving it wait seconds to come up.
+
+    The device is returned either way and keeps retrying in the background,
+    so a board plugged in later is picked up without restarting the lane.
+    """
+    device = SerialDevice(port, name).start()
+    if not device.wait_connected(wait):
+        log.warning("[WARNING] %s not connected yet; commands are dropped until it is", device)
+    return device
@@ -0,0 +1,80 @@
+import os
+import sys
+import tempfile
+import unittest
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_workdir = tempfile.TemporaryDirectory()
+_cwd = os.getcwd()
+os.chdir(_workdir.name)  # process_payment opens data/parking.db on import; keep it away from the real one
+try:
+    import process_payment
+finally:
+    os.chdir(_cwd)
+from parking_sessions import get_session, open_session
+
+
+class FakeCardReader:
+    """Stands in for the SerialDevice: remembers every PAY and leaves its reply to the test"""
+
+    def __init__(self):
+        self.requests = []
+
+    def request(self, command, match, timeout):
+        future = Future()
+        self.requests.append((command, future))
+        return future
+
+
+class DoubleTapTest(unittest.TestCase):
+    plate = 'RAB123A'
+
+    def setUp(self):
+        conn = process_payment.conn
+        with conn:
+            conn.execute("DELETE FROM transactions")
+            entered = (datetime.now() - timedelta(hours=2)).isoformat(sep=' ', timespec='seconds')
+            log_id = conn.execute("INSERT INTO plates_log (plate_number, payment_status, entry_timestamp, action_type) "
+                                  "VALUES (?, 0, ?, 'ENTRY')", (self.plate, entered)).lastrowid
+            open_session(conn, self.plate, log_id, entered)
+        process_payment.device = self.reader = FakeCardReader()
+        process_payment.paying.clear()
+        while not process_payment.events.empty():
+            process_payment.events.get_nowait()
+
+    def finish(self, reply):
+        self.reader.requests[-1][1].set_result(reply)
+        kind, payment, future = process_payment.events.get_nowait()
+        process_payment.finish_payment(payment, future)
+
+    def transactions(self):
+        return process_payment.conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    def test_second_card_line_during_pay_is_ignored(self):
+        line = f"PLATE:{self.plate}|BALANCE:5000"
+        process_payment.process_message(line)
+        process_payment.process_message(line)
+        self.assertEqual(len(self.reader.requests), 1)
+
+        self.finish("DONE")
+        self.assertEqual(self.transactions(), 1)
+        self.assertEqual(get_session(process_payment.conn, self.plate).payment_status, 1)
+
+        process_payment.process_message(line)  # paid a moment ago: inside the grace period, no new PAY
+        self.assertEqual(len(self.reader.requests), 1)
+
+    def test_failed_pay_lets_the_card_retry(self):
+        line = f"PLATE:{self.plate}|BALANCE:5000"
+        process_payment.process_message(line)
+        self.finish("FAIL")
+        self.assertEqual(self.transactions(), 0)
+
+        process_payment.process_message(line)
+        self.assertEqual(len(self.reader.requests), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()